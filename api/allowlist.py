@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# allowlist.py - Liste blanche compilée (réseaux qui ne doivent jamais être bloqués)
+#
+# Les CIDR (fichier + source externe, ex. base de l'API) sont fusionnés puis
+# compilés en intervalles triés et disjoints par famille : un test de
+# chevauchement coûte une recherche dichotomique, quelle que soit la taille
+# de la liste.
+
+import ipaddress
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ip_codec import IPNetwork, parse_target
+
+logger = logging.getLogger("allowlist")
+
+ALLOWLIST_FILE = os.environ.get("DYNFW_ALLOWLIST_FILE", "")
+ALLOWLIST_REFRESH = int(os.environ.get("DYNFW_ALLOWLIST_REFRESH", "30"))
+FILE_CHECK_INTERVAL = 1.0
+
+
+class Allowlist:
+    """Ensemble immuable de réseaux, compilé en intervalles [début, fin]."""
+
+    def __init__(self, networks: Iterable[IPNetwork] = ()):
+        self._starts: Dict[int, List[int]] = {}
+        self._ends: Dict[int, List[int]] = {}
+        self._nets: Dict[int, List[IPNetwork]] = {}
+        by_family: Dict[int, list] = {}
+        for net in networks:
+            by_family.setdefault(net.version, []).append(net)
+        self.size = 0
+        for family, nets in by_family.items():
+            collapsed = sorted(ipaddress.collapse_addresses(nets))
+            self._starts[family] = [int(n.network_address) for n in collapsed]
+            self._ends[family] = [int(n.broadcast_address) for n in collapsed]
+            self._nets[family] = collapsed
+            self.size += len(collapsed)
+
+    def match(self, target: IPNetwork) -> Optional[IPNetwork]:
+        """Réseau de la liste qui chevauche `target` (adresse ou CIDR), sinon None."""
+        starts = self._starts.get(target.version)
+        if not starts:
+            return None
+        lo, hi = int(target.network_address), int(target.broadcast_address)
+        # Intervalles disjoints et triés : seul le dernier qui commence avant
+        # `hi` peut chevaucher [lo, hi] (c'est aussi celui qui finit le plus loin)
+        i = bisect_right(starts, hi) - 1
+        if i >= 0 and self._ends[target.version][i] >= lo:
+            return self._nets[target.version][i]
+        return None
+
+    def overlapping(self, target: IPNetwork) -> List[IPNetwork]:
+        """Tous les réseaux de la liste qui chevauchent `target`, triés."""
+        starts = self._starts.get(target.version)
+        if not starts:
+            return []
+        lo, hi = int(target.network_address), int(target.broadcast_address)
+        # Fins triées elles aussi : premier intervalle qui finit après `lo`
+        first = bisect_left(self._ends[target.version], lo)
+        last = bisect_right(starts, hi)
+        return self._nets[target.version][first:last]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Allowlist) and self._nets == other._nets
+
+    __hash__ = None
+
+    def __contains__(self, value) -> bool:
+        return self.match(parse_target(value, strict=False)) is not None
+
+
+def parse_lines(lines: Iterable[str], origin: str = "") -> List[IPNetwork]:
+    """Un CIDR ou une adresse par ligne ; `#` commente la fin de ligne."""
+    networks = []
+    for lineno, line in enumerate(lines, 1):
+        entry = line.split("#", 1)[0].strip()
+        if not entry:
+            continue
+        try:
+            networks.append(parse_target(entry, strict=False))
+        except ValueError:
+            logger.warning("Allowlist %s:%d : entrée invalide %r", origin, lineno, entry)
+    return networks
+
+
+class AllowlistManager:
+    """
+    Détient l'Allowlist courante et la recompile quand le fichier change
+    (mtime vérifié au plus une fois par seconde) ou toutes les
+    `refresh_interval` secondes pour la source externe. `generation`
+    augmente à chaque recompilation qui change effectivement les réseaux.
+    """
+
+    def __init__(
+        self,
+        path: str = ALLOWLIST_FILE,
+        loader: Optional[Callable[[], Iterable[str]]] = None,
+        refresh_interval: int = ALLOWLIST_REFRESH,
+    ):
+        self.path = path
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._current = Allowlist()
+        self.generation = 0
+        self._external: List[IPNetwork] = []
+        self._mtime = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime if self.path else None
+        except OSError:
+            return None
+
+    def reload(self) -> Allowlist:
+        """Recompile depuis le fichier et la source externe."""
+        with self._lock:
+            mtime = self._file_mtime()
+            networks = []
+            if mtime is not None:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    networks += parse_lines(f, origin=self.path)
+            if self.loader is not None:
+                try:
+                    self._external = parse_lines(self.loader(), origin="db")
+                except Exception:
+                    # On garde les dernières entrées connues
+                    logger.exception("Allowlist : échec du chargement de la source externe")
+                networks += self._external
+            compiled = Allowlist(networks)
+            if compiled != self._current:
+                self.generation += 1
+            self._current = compiled
+            self._mtime = mtime
+            self._loaded_at = self._checked_at = time.monotonic()
+        logger.info("Allowlist rechargée : %d réseau(x)", self._current.size)
+        return self._current
+
+    def current(self) -> Allowlist:
+        now = time.monotonic()
+        if now - self._checked_at >= FILE_CHECK_INTERVAL:
+            self._checked_at = now
+            stale = self.loader is not None and self.refresh_interval \
+                and now - self._loaded_at >= self.refresh_interval
+            if stale or self._file_mtime() != self._mtime:
+                return self.reload()
+        return self._current
+
+    def match(self, target: IPNetwork) -> Optional[IPNetwork]:
+        return self.current().match(target)
+
+    def overlapping(self, target: IPNetwork) -> List[IPNetwork]:
+        return self.current().overlapping(target)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# bench_log_pipeline.py - Benchmark de montée en charge du pipeline de détection
+
+import argparse
+import os
+import time
+from functools import partial
+
+import log_analyzer_improved as la
+
+# ---------------------------------------------------------
+# GÉNÉRATION DE LIGNES SYNTHÉTIQUES
+# ---------------------------------------------------------
+TEMPLATES = [
+    "Jan 29 10:00:00 bastion sshd[1234]: Failed password for root from {ip} port 52211 ssh2",
+    "Jan 29 10:00:00 bastion sshd[1234]: Invalid user admin from {ip} port 40022",
+    "Jan 29 10:00:00 bastion sshd[1234]: Accepted publickey for deploy from {ip} port 51000 ssh2",
+    "Jan 29 10:00:00 bastion CRON[999]: pam_unix(cron:session): session opened for user root",
+]
+
+
+def synthetic_lines(count: int, distinct_ips: int):
+    """
+    Génère `count` lignes auth.log déterministes réparties sur `distinct_ips` IPs.
+    Le modèle change d'un passage à l'autre sur l'espace d'IPs : chaque IP voit
+    tous les modèles, même si `distinct_ips` est un multiple de leur nombre.
+    """
+    for i in range(count):
+        n = (i * 2654435761) % distinct_ips
+        ip = f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+        yield TEMPLATES[(i + i // distinct_ips) % len(TEMPLATES)].format(ip=ip)
+
+
+# ---------------------------------------------------------
+# MESURES
+# ---------------------------------------------------------
+def bench_single(count: int, distinct_ips: int) -> tuple:
+    """Référence : boucle mono-thread sans processus."""
+    table = la.defaultdict(la.deque)
+    detections = 0
+    start = time.perf_counter()
+    for line in synthetic_lines(count, distinct_ips):
+        ip = la.extract_ip(line)
+        if ip is None:
+            continue
+        if la.record_attempt(table, ip, time.time()) >= la.THRESHOLD:
+            table[ip].clear()
+            detections += 1
+    return time.perf_counter() - start, detections
+
+
+def bench_pipeline(count: int, distinct_ips: int, workers: int, chunk_size: int) -> tuple:
+    start = time.perf_counter()
+    # Fenêtre vidée par le worker à la détection, comme en mono : même travail,
+    # sans délai de resignalement ni aller-retour vers le dispatcher
+    detections = la.run_pipeline(
+        partial(synthetic_lines, count, distinct_ips),
+        on_detect=lambda ip: False,
+        workers=workers,
+        chunk_size=chunk_size,
+        clear_on_detect=True,
+    )
+    return time.perf_counter() - start, detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline de détection DynFW")
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--ips", type=int, default=50_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=la.CHUNK_LINES)
+    args = parser.parse_args()
+
+    la.logger.setLevel("WARNING")
+
+    elapsed, detections = bench_single(args.lines, args.ips)
+    baseline = args.lines / elapsed
+    print(f"{'mode':<10}{'lignes/s':>14}{'speedup':>10}{'détections':>13}")
+    print(f"{'mono':<10}{baseline:>14,.0f}{1.0:>10.2f}{detections:>13}")
+
+    expected = detections
+    for workers in range(1, args.max_workers + 1):
+        elapsed, detections = bench_pipeline(args.lines, args.ips, workers, args.chunk)
+        if detections != expected:
+            # Travail différent : le speedup ne voudrait rien dire
+            raise SystemExit(f"{workers} worker(s) : {detections} détections au lieu de {expected}")
+        rate = args.lines / elapsed
+        print(f"{workers:<10}{rate:>14,.0f}{rate / baseline:>10.2f}{detections:>13}")
+
+
+if __name__ == "__main__":
+    main()
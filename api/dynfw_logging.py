@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# dynfw_logging.py - Logging non bloquant partagé (API, manager, learner)
+#
+# Le thread appelant ne fait que filtrer et déposer l'enregistrement dans une
+# file bornée ; le formatage (%-args, JSON), l'écriture disque et la rotation
+# ont lieu dans un thread QueueListener. Les modules "bibliothèque" se
+# contentent de logging.getLogger(...) : seul le point d'entrée appelle
+# setup_logging().
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+LOG_DIR = os.environ.get(
+    "DYNFW_LOG_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+)
+LOG_LEVEL = os.environ.get("DYNFW_LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.environ.get("DYNFW_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("DYNFW_LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.environ.get("DYNFW_LOG_QUEUE_SIZE", "10000"))
+
+# Limitation des événements répétitifs (extra={"rate_key": ...})
+RATE_WINDOW = float(os.environ.get("DYNFW_LOG_RATE_WINDOW", "60"))
+RATE_BURST = int(os.environ.get("DYNFW_LOG_RATE_BURST", "5"))
+RATE_MAX_KEYS = 10000
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributs standard d'un LogRecord : tout le reste vient de `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "rate_key"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne : ts, level, logger, msg + champs `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Laisse passer RATE_BURST enregistrements par (message, rate_key) et par
+    fenêtre de RATE_WINDOW secondes. Le premier enregistrement d'une nouvelle
+    fenêtre porte le nombre d'enregistrements supprimés (`suppressed`).
+    Les enregistrements sans rate_key ne sont jamais filtrés.
+    """
+
+    def __init__(self, window: float = RATE_WINDOW, burst: int = RATE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.suppressed_total = 0
+        self._lock = threading.Lock()
+        self._state = {}  # clé -> [début de fenêtre, compte, supprimés]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate_key = getattr(record, "rate_key", None)
+        if rate_key is None:
+            return True
+
+        now = time.monotonic()
+        key = (record.msg, rate_key)
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                if len(self._state) >= RATE_MAX_KEYS:
+                    self._evict(now)
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            state[1] += 1
+            if state[1] <= self.burst:
+                return True
+            state[2] += 1
+            self.suppressed_total += 1
+            return False
+
+    def _evict(self, now: float) -> None:
+        expired = [k for k, s in self._state.items() if now - s[0] >= self.window]
+        for k in expired:
+            del self._state[k]
+        if len(self._state) >= RATE_MAX_KEYS:
+            self._state.clear()
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler qui ne formate pas dans le thread appelant (la file reste
+    dans le processus) et qui perd l'enregistrement plutôt que de bloquer
+    quand la file est pleine.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[LazyQueueHandler] = None
+_rate_filter: Optional[RateLimitFilter] = None
+
+
+def _install(handlers: list) -> None:
+    global _listener, _handler, _rate_filter
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _rate_filter = RateLimitFilter()
+    _handler = LazyQueueHandler(log_queue)
+    _handler.addFilter(_rate_filter)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stream_handler() -> logging.Handler:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def setup_logging(component: str, log_file: Optional[str] = None, json_file: bool = True) -> None:
+    """
+    Configure le logging du processus (idempotent).
+    - component : nom du fichier par défaut (<DYNFW_LOG_DIR>/<component>.jsonl)
+    - log_file  : chemin explicite du fichier JSON
+    - json_file : False -> stderr uniquement
+    """
+    with _lock:
+        if _listener is not None:
+            return
+
+        handlers = [_stream_handler()]
+        if json_file:
+            path = log_file or os.path.join(LOG_DIR, f"{component}.jsonl")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+
+        _install(handlers)
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Vide la file et arrête le thread d'écriture."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def stats() -> dict:
+    """Compteurs internes (enregistrements perdus / limités)."""
+    return {
+        "queue_dropped": _handler.dropped if _handler else 0,
+        "rate_suppressed": _rate_filter.suppressed_total if _rate_filter else 0,
+    }
+
+
+def _after_fork_in_child() -> None:
+    # Le thread d'écriture n'existe pas dans le processus enfant : nouvelle
+    # file et nouveau listener, vers stderr seulement (la rotation de fichier
+    # n'est pas sûre entre processus).
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    _listener = None
+    _install([_stream_handler()])
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
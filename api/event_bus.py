@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# event_bus.py - Pub/sub en mémoire des événements du firewall (block/unblock/expire)
+#
+# Les routes (threads du threadpool) publient ; chaque client /events possède
+# un tampon borné vidé par la boucle asyncio. Un client inactif ne coûte
+# qu'une entrée dans un set et un asyncio.Event au repos.
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+REPLAY_SIZE = int(os.environ.get("DYNFW_EVENTS_REPLAY", "1024"))
+SUBSCRIBER_BUFFER = int(os.environ.get("DYNFW_EVENTS_BUFFER", "256"))
+
+
+class Subscriber:
+    """Tampon borné d'un client : les plus anciens événements sont perdus en premier."""
+
+    __slots__ = ("queue", "dropped", "loop", "wakeup", "pending")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxlen: int):
+        self.queue = deque(maxlen=maxlen)
+        self.dropped = 0
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+        self.pending = False
+
+    def push(self, event: dict) -> None:
+        """Appelé depuis n'importe quel thread."""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(event)
+        self._wake()
+
+    def mark_dropped(self, count: int = 1) -> None:
+        """Signale au client une perte d'événements (il resynchronisera via /list)."""
+        self.dropped += count
+        self._wake()
+
+    def _wake(self) -> None:
+        if not self.pending:
+            self.pending = True
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def wait(self) -> None:
+        await self.wakeup.wait()
+
+    def drain(self) -> Tuple[int, List[dict]]:
+        """Appelé depuis la boucle asyncio : (événements perdus, événements en attente)."""
+        self.wakeup.clear()
+        self.pending = False
+        events = []
+        while self.queue:
+            events.append(self.queue.popleft())
+        dropped, self.dropped = self.dropped, 0
+        return dropped, events
+
+
+class EventBus:
+    def __init__(self, replay_size: int = REPLAY_SIZE, buffer_size: int = SUBSCRIBER_BUFFER):
+        self._lock = threading.Lock()
+        # Ids croissants d'un démarrage à l'autre (µs au démarrage) : un client
+        # qui reprend avec un id d'une instance précédente est détecté
+        self._first_id = time.time_ns() // 1000
+        self._ids = itertools.count(self._first_id)
+        self._last_id = self._first_id - 1
+        self._replay = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._listeners = []
+        self.buffer_size = buffer_size
+
+    def publish(self, event_type: str, **data) -> dict:
+        with self._lock:
+            self._last_id = next(self._ids)
+            event = {"id": self._last_id, "type": event_type, "ts": int(time.time()), **data}
+            self._replay.append(event)
+            subscribers = tuple(self._subscribers)
+            listeners = tuple(self._listeners)
+        for sub in subscribers:
+            sub.push(event)
+        for listener in listeners:
+            listener(event)
+        return event
+
+    def start_epoch(self) -> None:
+        """
+        Nouvelle série d'ids, postérieure à tout id déjà vu (ce processus
+        devient la source des événements). Les abonnés reçoivent un `dropped`.
+        """
+        with self._lock:
+            self._first_id = max(time.time_ns() // 1000, self._last_id + 1)
+            self._ids = itertools.count(self._first_id)
+            self._last_id = self._first_id - 1
+            self._replay.clear()
+            subscribers = tuple(self._subscribers)
+        for sub in subscribers:
+            sub.mark_dropped()
+
+    # -- Rediffusion (workers non leaders) ---------------------------------
+    def add_listener(self, callback) -> None:
+        """`callback(event)` appelé (dans le thread de publish) pour chaque événement."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback) -> None:
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def snapshot(self) -> Tuple[int, int, List[dict]]:
+        """(premier id, dernier id, historique) pour amorcer un relais."""
+        with self._lock:
+            return self._first_id, self._last_id, list(self._replay)
+
+    def reset(self, first_id: int, last_id: int, replay: List[dict]) -> None:
+        """
+        Adopte l'historique d'un autre bus (le leader). Les clients déjà
+        abonnés reçoivent un `dropped` : ce qui précède peut leur manquer.
+        """
+        with self._lock:
+            self._first_id = first_id
+            self._last_id = last_id
+            self._replay.clear()
+            self._replay.extend(replay)
+            subscribers = tuple(self._subscribers)
+        for sub in subscribers:
+            sub.mark_dropped()
+
+    def relay(self, event: dict) -> None:
+        """Diffuse un événement du leader en conservant son id."""
+        with self._lock:
+            if event["id"] <= self._last_id:
+                return  # déjà reçu via l'historique
+            self._last_id = event["id"]
+            self._replay.append(event)
+            subscribers = tuple(self._subscribers)
+        for sub in subscribers:
+            sub.push(event)
+
+    def subscribe(self, last_id: Optional[int] = None) -> Subscriber:
+        """
+        Enregistre un client (depuis la boucle asyncio).
+        - last_id : reprise après cet id ; les événements sortis de
+                    l'historique sont comptés comme perdus
+        """
+        sub = Subscriber(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            if last_id is not None:
+                if not self._first_id - 1 <= last_id <= self._last_id:
+                    # id d'une autre instance : historique inconnu, tout rejouer
+                    sub.dropped += 1
+                    backlog = list(self._replay)
+                else:
+                    backlog = [e for e in self._replay if e["id"] > last_id]
+                    oldest = backlog[0]["id"] if backlog else self._last_id + 1
+                    sub.dropped += oldest - last_id - 1
+                for event in backlog:
+                    sub.push(event)
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# feeds.py - Lecture des flux de blocage locaux (listes type Spamhaus DROP, IOC)
+#
+# Le fichier est lu ligne à ligne, les réseaux fusionnés par famille
+# (collapse) puis comparés à l'ensemble déjà appliqué pour ce flux : seul
+# le delta (ajouts / retraits) part vers le firewall et la base.
+
+import ipaddress
+import logging
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple
+
+from ip_codec import IPNetwork, parse_target, target_str
+
+logger = logging.getLogger("feeds")
+
+NAME_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+COMMENT_RE = re.compile(r"[#;]")
+MAX_LOGGED_INVALID = 5
+
+
+class FeedDelta(NamedTuple):
+    entries: int        # cibles après fusion
+    added: Set[str]
+    removed: Set[str]
+
+
+def valid_name(name: str) -> bool:
+    """Le nom finit dans un commentaire iptables : caractères sûrs uniquement."""
+    return bool(NAME_RE.match(name))
+
+
+def iter_networks(lines: Iterable[str], origin: str = "") -> Iterator[IPNetwork]:
+    """
+    Un CIDR ou une adresse en tête de ligne ; `#` et `;` commentent la fin
+    de ligne (format DROP : `1.10.16.0/20 ; SBL256894`). Les lignes
+    invalides sont ignorées (les premières sont loguées).
+    """
+    invalid = 0
+    for lineno, line in enumerate(lines, 1):
+        entry = COMMENT_RE.split(line, 1)[0].strip()
+        if not entry:
+            continue
+        try:
+            yield parse_target(entry.split()[0], strict=False)
+        except ValueError:
+            invalid += 1
+            if invalid <= MAX_LOGGED_INVALID:
+                # Numéro de ligne seulement : le contenu n'a pas à finir dans les journaux
+                logger.warning("Flux %s:%d : entrée invalide", origin, lineno)
+    if invalid > MAX_LOGGED_INVALID:
+        logger.warning("Flux %s : %d entrée(s) invalide(s) au total", origin, invalid)
+
+
+def collapse(networks: Iterable[IPNetwork]) -> List[IPNetwork]:
+    """Fusionne les réseaux adjacents ou inclus, famille par famille."""
+    by_family: Dict[int, list] = {}
+    for net in networks:
+        by_family.setdefault(net.version, []).append(net)
+    collapsed = []
+    for family in sorted(by_family):
+        collapsed += ipaddress.collapse_addresses(by_family[family])
+    return collapsed
+
+
+def load(path: str) -> List[IPNetwork]:
+    """Lit et fusionne un fichier de flux sans le charger en entier en mémoire."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return collapse(iter_networks(f, origin=path))
+
+
+def diff(wanted: Iterable[IPNetwork], applied: Set[str]) -> FeedDelta:
+    """Delta entre les cibles voulues et celles déjà appliquées (formes canoniques)."""
+    targets = {target_str(net) for net in wanted}
+    return FeedDelta(len(targets), targets - applied, applied - targets)
+
+
+def _exclude(net: IPNetwork, other: IPNetwork) -> List[IPNetwork]:
+    """`net` privé de `other` (deux CIDR se chevauchent seulement par inclusion)."""
+    if other.supernet_of(net):
+        return []
+    if net.supernet_of(other):
+        return list(net.address_exclude(other))
+    return [net]
+
+
+def split_allowlisted(networks: Iterable[IPNetwork], overlapping) -> Tuple[List[IPNetwork], List[IPNetwork]]:
+    """
+    Retire des réseaux du flux les parties couvertes par l'allowlist
+    (`overlapping` -> réseaux qui chevauchent). Le reste d'une plage reste
+    appliqué : 10.0.0.0/8 moins 10.1.2.3 donne 24 CIDR. Retourne
+    (cibles conservées, parties exclues).
+    """
+    kept, skipped = [], []
+    for net in networks:
+        pieces = [net]
+        for other in overlapping(net):
+            skipped.append(net if other.supernet_of(net) else other)
+            pieces = [rest for piece in pieces for rest in _exclude(piece, other)]
+        kept += pieces
+    return kept, skipped
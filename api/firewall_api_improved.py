@@ -3,35 +3,42 @@
 
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, IPvAnyAddress
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, IPvAnyAddress, IPvAnyNetwork
 import sqlite3
 import time
 import subprocess
-from typing import Optional
+import ipaddress
+import asyncio
+import json
+import math
+import threading
+from typing import List, Optional, Union
 import ipTables_manager as im
+import feeds
+import ip_codec
+import event_bus
+import dynfw_logging
+import allowlist
+import metrics
+import rate_limit
+import leader
 import logging
 import os
 from contextlib import contextmanager
 import re
 
 # ---------------------------------------------------------
-# CONFIG LOGGING (api.log)
+# CONFIG LOGGING (JSON, écriture en arrière-plan)
 # ---------------------------------------------------------
-LOG_PATH = os.environ.get(
-    "DYNFW_API_LOG",
-    "/home/mamy/Desktop/Projet_fin_annee/Firewall_project/api/api.log"
-)
+# Par défaut : <DYNFW_LOG_DIR>/api.jsonl (rotation par taille) ; avec
+# plusieurs workers, un fichier par processus (rotation non partageable)
+LOG_PATH = os.environ.get("DYNFW_API_LOG")
+API_WORKERS = int(os.environ.get("DYNFW_API_WORKERS", "1"))
+if LOG_PATH is None and API_WORKERS > 1:
+    LOG_PATH = os.path.join(dynfw_logging.LOG_DIR, f"api-{os.getpid()}.jsonl")
 
-os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_PATH),
-        logging.StreamHandler()
-    ]
-)
+dynfw_logging.setup_logging("api", log_file=LOG_PATH)
 
 logger = logging.getLogger("dynfw_api")
 
@@ -40,6 +47,43 @@ logger = logging.getLogger("dynfw_api")
 # ---------------------------------------------------------
 DB_PATH = os.environ.get("DYNFW_DB", "/var/lib/dynfw/dynfw.db")
 API_TOKEN = os.environ.get("DYNFW_API_TOKEN", "MyToken")
+EXPIRE_INTERVAL = int(os.environ.get("DYNFW_EXPIRE_INTERVAL", "30"))
+
+# Compteurs noyau par bloc (0 = collecte désactivée)
+COUNTERS_INTERVAL = int(os.environ.get("DYNFW_COUNTERS_INTERVAL", "60"))
+STATS_BUCKET = int(os.environ.get("DYNFW_STATS_BUCKET", "3600"))
+STATS_RETENTION = int(os.environ.get("DYNFW_STATS_RETENTION", str(7 * 86400)))
+
+# Élagage des blocs "froids" (0 hit depuis PRUNE_IDLE secondes, 0 = désactivé)
+#   remove : retire le bloc ; demote : ramène son TTL à PRUNE_DEMOTE_TTL
+PRUNE_IDLE = int(os.environ.get("DYNFW_PRUNE_IDLE", "0"))
+PRUNE_ACTION = os.environ.get("DYNFW_PRUNE_ACTION", "demote")
+PRUNE_DEMOTE_TTL = int(os.environ.get("DYNFW_PRUNE_DEMOTE_TTL", "3600"))
+EVENTS_KEEPALIVE = 15
+
+# Récidive : la n-ième récidive dans RECIDIVE_LOOKBACK secondes reçoit
+# TTL × RECIDIVE_FACTOR^n (plafonné à RECIDIVE_MAX_TTL, 0 = sans plafond),
+# et devient permanente à partir de RECIDIVE_PERMANENT_AFTER récidives
+# (0 = jamais). RECIDIVE_FACTOR = 1 désactive l'escalade.
+RECIDIVE_LOOKBACK = int(os.environ.get("DYNFW_RECIDIVE_LOOKBACK", str(30 * 86400)))
+RECIDIVE_FACTOR = float(os.environ.get("DYNFW_RECIDIVE_FACTOR", "4"))
+RECIDIVE_MAX_TTL = int(os.environ.get("DYNFW_RECIDIVE_MAX_TTL", "0"))
+RECIDIVE_PERMANENT_AFTER = int(os.environ.get("DYNFW_RECIDIVE_PERMANENT_AFTER", "3"))
+OFFENSE_RETENTION = int(os.environ.get("DYNFW_OFFENSE_RETENTION", str(90 * 86400)))
+TTL_CEILING = 100 * 365 * 86400  # plafond implicite sans RECIDIVE_MAX_TTL
+
+# Flux de blocage : resynchronisés quand leur fichier change (0 = à la demande).
+# Seuls les fichiers sous FEED_DIR peuvent être enregistrés
+FEED_INTERVAL = int(os.environ.get("DYNFW_FEED_INTERVAL", "300"))
+FEED_DIR = os.path.realpath(os.environ.get("DYNFW_FEED_DIR", "/etc/dynfw/feeds"))
+
+# Multi-workers : le processus qui tient LEADER_LOCK est le seul à toucher
+# iptables et à lancer la maintenance ; les autres lui transmettent les
+# écritures via LEADER_SOCKET (socket Unix authentifié par le token)
+DATA_DIR = os.path.dirname(DB_PATH) or "."
+LEADER_LOCK = os.environ.get("DYNFW_LEADER_LOCK", os.path.join(DATA_DIR, "api.leader.lock"))
+LEADER_SOCKET = os.environ.get("DYNFW_LEADER_SOCKET", os.path.join(DATA_DIR, "api.leader.sock"))
+LEADER_RETRY = 1
 
 # ---------------------------------------------------------
 # FASTAPI
@@ -50,7 +94,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# CORS
+# Limitation de débit (avant routage et authentification)
+limiter = rate_limit.RateLimiter(is_valid_token=lambda header: header == f"Bearer {API_TOKEN}")
+app.add_middleware(rate_limit.RateLimitMiddleware, limiter=limiter)
+
+# CORS : ajouté en dernier, donc le plus externe. Les preflights sont
+# servis avant la limitation et les 429 portent les en-têtes CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -70,10 +119,18 @@ def get_db_connection():
     finally:
         conn.close()
 
+# Version du schéma (PRAGMA user_version)
+#   2 : colonnes binaires family/addr/prefixlen + index composite
+SCHEMA_VERSION = 2
+
+BLOCK_COLUMNS = "ip, port, reason, ts, expires_at"
+
 def init_db():
     os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
     with get_db_connection() as conn:
         c = conn.cursor()
+        # WAL : les lectures des workers ne bloquent pas les écritures du leader
+        c.execute("PRAGMA journal_mode=WAL")
         c.execute("""
             CREATE TABLE IF NOT EXISTS blocks (
                 id INTEGER PRIMARY KEY,
@@ -81,43 +138,537 @@ def init_db():
                 port INTEGER,
                 reason TEXT,
                 ts INTEGER,
-                expires_at INTEGER
+                expires_at INTEGER,
+                family INTEGER,
+                addr BLOB,
+                prefixlen INTEGER
             )
         """)
         c.execute("""
             CREATE INDEX IF NOT EXISTS idx_expires_at
             ON blocks(expires_at)
         """)
+        migrate_db(conn)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_blocks_addr
+            ON blocks(family, addr, prefixlen)
+        """)
+        # Dernier relevé des compteurs iptables (cumulés) par bloc
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS block_counters (
+                ip TEXT PRIMARY KEY,
+                pkts INTEGER,
+                bytes INTEGER,
+                last_hit INTEGER,
+                sampled_at INTEGER
+            )
+        """)
+        # Deltas agrégés par tranche de STATS_BUCKET secondes
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS block_stats (
+                ip TEXT,
+                bucket INTEGER,
+                pkts INTEGER,
+                bytes INTEGER,
+                PRIMARY KEY (ip, bucket)
+            )
+        """)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_block_stats_bucket
+            ON block_stats(bucket)
+        """)
+        # Historique des blocages (une ligne par infraction) + résumé par cible
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS offenses (
+                id INTEGER PRIMARY KEY,
+                ip TEXT,
+                ts INTEGER,
+                reason TEXT,
+                ttl INTEGER
+            )
+        """)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_offenses_ip_ts
+            ON offenses(ip, ts)
+        """)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_offenses_ts
+            ON offenses(ts)
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS offenders (
+                ip TEXT PRIMARY KEY,
+                offenses INTEGER,
+                first_seen INTEGER,
+                last_seen INTEGER,
+                last_ttl INTEGER,
+                last_reason TEXT
+            )
+        """)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_offenders_last_seen
+            ON offenders(last_seen)
+        """)
+        # Flux de blocage enregistrés, cibles appliquées par flux, historique des synchros
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS feeds (
+                name TEXT PRIMARY KEY,
+                path TEXT,
+                reason TEXT,
+                created INTEGER,
+                mtime REAL,
+                last_sync INTEGER,
+                entries INTEGER DEFAULT 0
+            )
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS feed_entries (
+                feed TEXT,
+                ip TEXT,
+                PRIMARY KEY (feed, ip)
+            ) WITHOUT ROWID
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS feed_syncs (
+                id INTEGER PRIMARY KEY,
+                feed TEXT,
+                ts INTEGER,
+                entries INTEGER,
+                added INTEGER,
+                removed INTEGER,
+                allowlisted INTEGER,
+                parse_ms REAL,
+                apply_ms REAL,
+                db_ms REAL,
+                error TEXT
+            )
+        """)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_feed_syncs_feed_ts
+            ON feed_syncs(feed, ts)
+        """)
+        # Réseaux jamais bloqués (s'ajoutent à DYNFW_ALLOWLIST_FILE)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS allowlist (
+                id INTEGER PRIMARY KEY,
+                cidr TEXT UNIQUE,
+                comment TEXT,
+                ts INTEGER
+            )
+        """)
         conn.commit()
     logger.info("Base de données initialisée")
 
-def add_db_block(ip: str, reason: Optional[str], ttl_seconds: Optional[int], port: Optional[int] = None):
+def migrate_db(conn: sqlite3.Connection):
+    """Ajoute les colonnes binaires et remplit les lignes existantes en une passe."""
+    c = conn.cursor()
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    columns = {row[1] for row in c.execute("PRAGMA table_info(blocks)")}
+    for name, decl in (("family", "INTEGER"), ("addr", "BLOB"), ("prefixlen", "INTEGER")):
+        if name not in columns:
+            c.execute(f"ALTER TABLE blocks ADD COLUMN {name} {decl}")
+
+    updates = []
+    for row_id, ip in c.execute("SELECT id, ip FROM blocks WHERE addr IS NULL").fetchall():
+        try:
+            net = ip_codec.parse_target(ip, strict=False)
+        except ValueError:
+            logger.warning(f"Migration: entrée ignorée (IP invalide) id={row_id} ip={ip!r}")
+            continue
+        updates.append(ip_codec.encode(net) + (row_id,))
+
+    c.executemany("UPDATE blocks SET family = ?, addr = ?, prefixlen = ? WHERE id = ?", updates)
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    logger.info(f"Migration du schéma v{version} -> v{SCHEMA_VERSION} ({len(updates)} ligne(s))")
+
+def remove_db_block(ip: str):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM blocks WHERE ip = ?", (ip,))
+        c.execute("DELETE FROM block_counters WHERE ip = ?", (ip,))
+        conn.commit()
+
+def _rows_to_blocks(rows):
+    return [
+        {"ip": r[0], "port": r[1], "reason": r[2], "ts": r[3], "expires_at": r[4]}
+        for r in rows
+    ]
+
+def get_blocks():
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {BLOCK_COLUMNS} FROM blocks ORDER BY ts DESC")
+        rows = c.fetchall()
+    return _rows_to_blocks(rows)
+
+def get_block(ip: str):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        row = c.execute(f"SELECT {BLOCK_COLUMNS} FROM blocks WHERE ip = ?", (ip,)).fetchone()
+    return _rows_to_blocks([row])[0] if row else None
+
+def get_expired_ips(now: int) -> List[str]:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT ip FROM blocks WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (now,)
+        )
+        return [r[0] for r in c.fetchall()]
+
+def get_blocks_in(net: ip_codec.IPNetwork):
+    """Blocs entièrement contenus dans `net` (scan indexé BETWEEN)."""
+    family, lo, hi = ip_codec.bounds(net)
     with get_db_connection() as conn:
         c = conn.cursor()
-        ts = int(time.time())
-        expires_at = ts + ttl_seconds if ttl_seconds else None
         c.execute(
-            "INSERT OR REPLACE INTO blocks(ip, port, reason, ts, expires_at) VALUES (?,?,?,?,?)",
-            (ip, port, reason, ts, expires_at)
+            f"SELECT {BLOCK_COLUMNS} FROM blocks "
+            "WHERE family = ? AND addr BETWEEN ? AND ? AND prefixlen >= ? "
+            "ORDER BY addr, prefixlen",
+            (family, lo, hi, net.prefixlen)
         )
+        rows = c.fetchall()
+    return _rows_to_blocks(rows)
+
+def get_blocks_covering(addr: ip_codec.IPAddress):
+    """Blocs (adresse ou CIDR) qui couvrent `addr` : une recherche indexée par préfixe possible."""
+    keys = ip_codec.covering_keys(addr)
+    candidates = sorted(set(keys.values()))
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            f"SELECT {BLOCK_COLUMNS}, addr, prefixlen FROM blocks "
+            f"WHERE family = ? AND addr IN ({','.join('?' * len(candidates))}) "
+            "ORDER BY prefixlen DESC",
+            (addr.version, *candidates)
+        )
+        rows = [r[:5] for r in c.fetchall() if keys.get(r[6]) == r[5]]
+    return _rows_to_blocks(rows)
+
+def store_counters(counters: dict, now: int) -> int:
+    """
+    Enregistre un relevé des compteurs iptables en une transaction :
+    delta depuis le relevé précédent (compteur remis à zéro -> valeur brute),
+    ajouté à la tranche courante de block_stats. Retourne le nombre de blocs touchés.
+    """
+    bucket = now - now % STATS_BUCKET
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        blocked = {r[0] for r in c.execute("SELECT ip FROM blocks")}
+        previous = {
+            r[0]: (r[1], r[2], r[3])
+            for r in c.execute("SELECT ip, pkts, bytes, last_hit FROM block_counters")
+        }
+
+        snapshots, deltas = [], []
+        for ip, (pkts, nbytes) in counters.items():
+            if ip not in blocked:
+                continue
+            prev_pkts, prev_bytes, last_hit = previous.get(ip, (0, 0, None))
+            d_pkts = pkts - prev_pkts if pkts >= prev_pkts else pkts
+            d_bytes = nbytes - prev_bytes if nbytes >= prev_bytes else nbytes
+            if d_pkts:
+                last_hit = now
+                deltas.append((ip, bucket, d_pkts, d_bytes))
+            snapshots.append((ip, pkts, nbytes, last_hit, now))
+
+        c.executemany(
+            "INSERT OR REPLACE INTO block_counters(ip, pkts, bytes, last_hit, sampled_at) "
+            "VALUES (?,?,?,?,?)",
+            snapshots
+        )
+        c.executemany(
+            "INSERT INTO block_stats(ip, bucket, pkts, bytes) VALUES (?,?,?,?) "
+            "ON CONFLICT(ip, bucket) DO UPDATE SET "
+            "pkts = pkts + excluded.pkts, bytes = bytes + excluded.bytes",
+            deltas
+        )
+        c.execute("DELETE FROM block_stats WHERE bucket < ?", (now - STATS_RETENTION,))
         conn.commit()
+    return len(snapshots)
 
-def remove_db_block(ip: str):
+def get_hit_summary(limit: int = 100, cold_only: bool = False):
+    """Blocs triés par paquets bloqués (compteur cumulé du dernier relevé)."""
+    query = (
+        "SELECT b.ip, b.port, b.reason, b.ts, b.expires_at, "
+        "k.pkts, k.bytes, k.last_hit, k.sampled_at "
+        "FROM blocks b LEFT JOIN block_counters k ON k.ip = b.ip "
+    )
+    if cold_only:
+        query += "WHERE k.ip IS NOT NULL AND k.last_hit IS NULL "
+    query += "ORDER BY COALESCE(k.pkts, 0) DESC, b.ts DESC LIMIT ?"
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute("DELETE FROM blocks WHERE ip = ?", (ip,))
+        rows = c.execute(query, (limit,)).fetchall()
+    return [
+        {"ip": r[0], "port": r[1], "reason": r[2], "ts": r[3], "expires_at": r[4],
+         "pkts": r[5], "bytes": r[6], "last_hit": r[7], "sampled_at": r[8]}
+        for r in rows
+    ]
+
+def get_block_stats(ip: str, since: int):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        rows = c.execute(
+            "SELECT bucket, pkts, bytes FROM block_stats "
+            "WHERE ip = ? AND bucket >= ? ORDER BY bucket",
+            (ip, since)
+        ).fetchall()
+    return [{"bucket": r[0], "pkts": r[1], "bytes": r[2]} for r in rows]
+
+def get_cold_blocks(cutoff: int):
+    """Blocs relevés au moins une fois et sans hit (ni création) depuis `cutoff`."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        return c.execute(
+            "SELECT b.ip, b.expires_at FROM blocks b "
+            "JOIN block_counters k ON k.ip = b.ip "
+            "WHERE COALESCE(k.last_hit, b.ts) < ?",
+            (cutoff,)
+        ).fetchall()
+
+def set_db_expiry(ips: List[str], expires_at: int):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.executemany(
+            "UPDATE blocks SET expires_at = ? WHERE ip = ?",
+            [(expires_at, ip) for ip in ips]
+        )
         conn.commit()
 
-def get_blocks():
+def recidive_ttl(base_ttl: Optional[int], prior: int) -> Optional[int]:
+    """TTL appliqué après `prior` infractions récentes (None = permanent)."""
+    if base_ttl is None:
+        return None
+    if RECIDIVE_PERMANENT_AFTER and prior >= RECIDIVE_PERMANENT_AFTER:
+        return None
+    if RECIDIVE_FACTOR <= 1 or base_ttl <= 0:
+        return base_ttl
+    cap = max(base_ttl, RECIDIVE_MAX_TTL or TTL_CEILING)
+    # Plafond atteint : ne pas calculer FACTOR^prior (OverflowError si prior est grand)
+    if prior >= math.log(cap / base_ttl, RECIDIVE_FACTOR):
+        return cap
+    return min(int(base_ttl * RECIDIVE_FACTOR ** prior), cap)
+
+def block_state(ip: str, port: Optional[int], base_ttl: Optional[int], now: int) -> dict:
+    """
+    Décision pour un /block (à appeler sous `_write_lock`) :
+    - "duplicate" : déjà bloquée sur ce port jusqu'à au moins l'échéance demandée
+    - "extend"    : déjà bloquée sur ce port, l'échéance demandée est plus lointaine
+    - "new"       : nouveau bloc (ou autre port), TTL d'après les infractions
+                    des RECIDIVE_LOOKBACK dernières secondes
+    """
+    with get_db_connection() as conn:
+        current = conn.execute(
+            "SELECT port, expires_at FROM blocks WHERE ip = ?", (ip,)
+        ).fetchone()
+        if current and current[0] == port and (current[1] is None or current[1] > now):
+            wanted = now + base_ttl if base_ttl is not None else None
+            if current[1] is None or (wanted is not None and wanted <= current[1]):
+                return {"action": "duplicate", "expires_at": current[1]}
+            return {"action": "extend", "expires_at": wanted}
+        prior = conn.execute(
+            "SELECT COUNT(*) FROM offenses WHERE ip = ? AND ts > ?",
+            (ip, now - RECIDIVE_LOOKBACK)
+        ).fetchone()[0]
+    ttl = recidive_ttl(base_ttl, prior)
+    return {"action": "new", "replaced": current is not None, "ttl": ttl, "prior": prior,
+            "expires_at": now + ttl if ttl else None}
+
+def record_block(ip: str, port: Optional[int], reason: Optional[str], now: int,
+                 ttl: Optional[int], expires_at: Optional[int]):
+    """Bloc posé : infraction, résumé du récidiviste et bloc en une transaction."""
+    family, addr, prefixlen = ip_codec.encode(ip_codec.parse_target(ip))
     with get_db_connection() as conn:
+        conn.isolation_level = None
         c = conn.cursor()
-        c.execute("SELECT ip, port, reason, ts, expires_at FROM blocks ORDER BY ts DESC")
-        rows = c.fetchall()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(
+                "INSERT INTO offenses(ip, ts, reason, ttl) VALUES (?,?,?,?)",
+                (ip, now, reason, ttl)
+            )
+            c.execute(
+                "INSERT INTO offenders(ip, offenses, first_seen, last_seen, last_ttl, last_reason) "
+                "VALUES (?,1,?,?,?,?) "
+                "ON CONFLICT(ip) DO UPDATE SET offenses = offenses + 1, "
+                "last_seen = excluded.last_seen, last_ttl = excluded.last_ttl, "
+                "last_reason = excluded.last_reason",
+                (ip, now, now, ttl, reason)
+            )
+            c.execute(
+                "INSERT OR REPLACE INTO blocks(ip, port, reason, ts, expires_at, family, addr, prefixlen) "
+                "VALUES (?,?,?,?,?,?,?,?)",
+                (ip, port, reason, now, expires_at, family, addr, prefixlen)
+            )
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+
+def extend_db_block(ip: str, reason: Optional[str], expires_at: Optional[int]):
+    """Repousse l'échéance d'un bloc actif (règle iptables inchangée)."""
+    with get_db_connection() as conn:
+        conn.execute(
+            "UPDATE blocks SET expires_at = ?, reason = COALESCE(?, reason) WHERE ip = ?",
+            (expires_at, reason, ip)
+        )
+        conn.commit()
+
+def purge_offenses(cutoff: int) -> int:
+    """Oublie le détail des infractions antérieures à `cutoff` (le résumé est conservé)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM offenses WHERE ts < ?", (cutoff,))
+        conn.commit()
+        return c.rowcount
+
+def get_offenders(limit: int = 100, since: Optional[int] = None):
+    """Cibles les plus souvent bloquées (vues depuis `since` si précisé)."""
+    query = "SELECT ip, offenses, first_seen, last_seen, last_ttl, last_reason FROM offenders "
+    params = []
+    if since is not None:
+        query += "WHERE last_seen >= ? "
+        params.append(since)
+    query += "ORDER BY offenses DESC, last_seen DESC LIMIT ?"
+    params.append(limit)
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        rows = c.execute(query, params).fetchall()
     return [
-        {"ip": r[0], "port": r[1], "reason": r[2], "ts": r[3], "expires_at": r[4]}
+        {"ip": r[0], "offenses": r[1], "first_seen": r[2], "last_seen": r[3],
+         "last_ttl": r[4], "last_reason": r[5]}
         for r in rows
     ]
 
+def get_offense_history(ip: str):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        rows = c.execute(
+            "SELECT ts, reason, ttl FROM offenses WHERE ip = ? ORDER BY ts",
+            (ip,)
+        ).fetchall()
+    return [{"ts": r[0], "reason": r[1], "ttl": r[2]} for r in rows]
+
+FEED_COLUMNS = "name, path, reason, created, mtime, last_sync, entries"
+
+def _row_to_feed(r):
+    return {"name": r[0], "path": r[1], "reason": r[2], "created": r[3],
+            "mtime": r[4], "last_sync": r[5], "entries": r[6]}
+
+def get_feeds():
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        rows = c.execute(f"SELECT {FEED_COLUMNS} FROM feeds ORDER BY name").fetchall()
+    return [_row_to_feed(r) for r in rows]
+
+def get_feed(name: str):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        row = c.execute(f"SELECT {FEED_COLUMNS} FROM feeds WHERE name = ?", (name,)).fetchone()
+    return _row_to_feed(row) if row else None
+
+def add_db_feed(name: str, path: str, reason: Optional[str]):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "INSERT INTO feeds(name, path, reason, created) VALUES (?,?,?,?) "
+            "ON CONFLICT(name) DO UPDATE SET path = excluded.path, reason = excluded.reason, mtime = NULL",
+            (name, path, reason, int(time.time()))
+        )
+        conn.commit()
+
+def remove_db_feed(name: str):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM feed_entries WHERE feed = ?", (name,))
+        c.execute("DELETE FROM feed_syncs WHERE feed = ?", (name,))
+        c.execute("DELETE FROM feeds WHERE name = ?", (name,))
+        conn.commit()
+
+def get_feed_entries(name: str) -> set:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        return {r[0] for r in c.execute("SELECT ip FROM feed_entries WHERE feed = ?", (name,))}
+
+def reset_feed_entries():
+    """Chaîne des flux recréée (vide) : tout sera réappliqué à la prochaine synchro."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM feed_entries")
+        c.execute("UPDATE feeds SET mtime = NULL, entries = 0")
+        conn.commit()
+
+def store_feed_sync(name: str, delta: feeds.FeedDelta, mtime: float, stats: dict) -> float:
+    """Applique le delta du flux en base et historise la synchro (une transaction). Retourne sa durée en ms."""
+    start = time.perf_counter()
+    now = int(time.time())
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.executemany("DELETE FROM feed_entries WHERE feed = ? AND ip = ?",
+                      [(name, ip) for ip in delta.removed])
+        c.executemany("INSERT OR IGNORE INTO feed_entries(feed, ip) VALUES (?,?)",
+                      [(name, ip) for ip in delta.added])
+        c.execute("UPDATE feeds SET mtime = ?, last_sync = ?, entries = ? WHERE name = ?",
+                  (mtime, now, delta.entries, name))
+        db_ms = round((time.perf_counter() - start) * 1000, 3)
+        c.execute(
+            "INSERT INTO feed_syncs(feed, ts, entries, added, removed, allowlisted, "
+            "parse_ms, apply_ms, db_ms) VALUES (?,?,?,?,?,?,?,?,?)",
+            (name, now, delta.entries, len(delta.added), len(delta.removed),
+             stats["allowlisted"], stats["parse_ms"], stats["apply_ms"], db_ms)
+        )
+        c.execute("DELETE FROM feed_syncs WHERE ts < ?", (now - STATS_RETENTION,))
+        conn.commit()
+    return db_ms
+
+def record_feed_error(name: str, error: str):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO feed_syncs(feed, ts, error) VALUES (?,?,?)",
+                  (name, int(time.time()), error[:500]))
+        conn.commit()
+
+def get_feed_syncs(name: str, limit: int = 20):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        rows = c.execute(
+            "SELECT ts, entries, added, removed, allowlisted, parse_ms, apply_ms, db_ms, error "
+            "FROM feed_syncs WHERE feed = ? ORDER BY ts DESC, id DESC LIMIT ?",
+            (name, limit)
+        ).fetchall()
+    return [
+        {"ts": r[0], "entries": r[1], "added": r[2], "removed": r[3], "allowlisted": r[4],
+         "parse_ms": r[5], "apply_ms": r[6], "db_ms": r[7], "error": r[8]}
+        for r in rows
+    ]
+
+def get_allowlist_entries():
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        rows = c.execute("SELECT cidr, comment, ts FROM allowlist ORDER BY ts").fetchall()
+    return [{"cidr": r[0], "comment": r[1], "ts": r[2]} for r in rows]
+
+def add_db_allow(cidr: str, comment: Optional[str]):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "INSERT OR REPLACE INTO allowlist(cidr, comment, ts) VALUES (?,?,?)",
+            (cidr, comment, int(time.time()))
+        )
+        conn.commit()
+
+def remove_db_allow(cidr: str) -> bool:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM allowlist WHERE cidr = ?", (cidr,))
+        conn.commit()
+        return c.rowcount > 0
+
 # ---------------------------------------------------------
 # AUTHENTIFICATION TOKEN (LOGUÉE)
 # ---------------------------------------------------------
@@ -126,59 +677,650 @@ def check_token(request: Request):
     client_ip = request.client.host if request.client else "unknown"
 
     if token != f"Bearer {API_TOKEN}":
-        logger.warning(f"AUTH_FAILED from {client_ip}")
+        limiter.record_auth_failure(client_ip)
+        logger.warning("AUTH_FAILED from %s", client_ip,
+                       extra={"client_ip": client_ip, "rate_key": client_ip})
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 # ---------------------------------------------------------
 # SCHEMAS
 # ---------------------------------------------------------
 class BlockReq(BaseModel):
-    ip: IPvAnyAddress
+    ip: Union[IPvAnyAddress, IPvAnyNetwork]
     ttl_seconds: Optional[int] = None
     reason: Optional[str] = None
     port: Optional[int] = None
 
 class UnblockReq(BaseModel):
-    ip: IPvAnyAddress
+    ip: Union[IPvAnyAddress, IPvAnyNetwork]
+
+class FeedReq(BaseModel):
+    name: str
+    path: str
+    reason: Optional[str] = None
+
+class FeedNameReq(BaseModel):
+    name: str
+
+class AllowReq(BaseModel):
+    cidr: Union[IPvAnyAddress, IPvAnyNetwork]
+    comment: Optional[str] = None
+
+def target_of(value) -> str:
+    """Forme canonique stockée dans blocks.ip (adresse seule ou CIDR)."""
+    try:
+        return ip_codec.target_str(ip_codec.parse_target(value))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Cible invalide: {e}")
+
+# ---------------------------------------------------------
+# ALLOWLIST
+# ---------------------------------------------------------
+allow = allowlist.AllowlistManager(loader=lambda: [e["cidr"] for e in get_allowlist_entries()])
+
+def ensure_not_allowlisted(ip: str, source: str):
+    """Refuse (403) toute cible qui chevauche un réseau de l'allowlist."""
+    match = allow.match(ip_codec.parse_target(ip))
+    if match is not None:
+        metrics.inc("dynfw_allowlist_rejections_total", source=source)
+        logger.warning("ALLOWLIST_REJECT target=%s allowlisted=%s source=%s", ip, match, source,
+                       extra={"target": ip, "rate_key": ip})
+        raise HTTPException(status_code=403, detail=f"{ip} chevauche l'allowlist ({match})")
+
+# ---------------------------------------------------------
+# ÉVÉNEMENTS & MAINTENANCE
+# ---------------------------------------------------------
+bus = event_bus.EventBus()
+_maintenance_stop = threading.Event()
+_feed_lock = threading.Lock()
+# Sérialise toutes les écritures du leader (iptables + base) : requêtes
+# locales, RPC des autres workers et maintenance. Réentrant : une op peut
+# en appeler une autre (feed_add -> feed_sync, allow_add -> sync_feeds).
+_write_lock = threading.RLock()
+
+def sync_feed(name: str, force: bool = True) -> Optional[dict]:
+    """
+    Synchronise un flux : lecture + fusion du fichier, delta avec les cibles
+    déjà appliquées, une transaction iptables-restore puis une transaction
+    SQLite. Sans `force`, ne fait rien si le fichier n'a pas changé (None).
+    """
+    feed = get_feed(name)
+    if feed is None:
+        raise KeyError(name)
+
+    with _feed_lock:
+        start = time.perf_counter()
+        try:
+            mtime = os.stat(feed["path"]).st_mtime
+            if not force and mtime == feed["mtime"]:
+                return None
+            wanted, skipped = feeds.split_allowlisted(feeds.load(feed["path"]), allow.overlapping)
+        except OSError as e:
+            record_feed_error(name, str(e))
+            metrics.inc("dynfw_feed_syncs_total", feed=name, status="error")
+            raise
+        delta = feeds.diff(wanted, get_feed_entries(name))
+        parsed = time.perf_counter()
+
+        try:
+            if delta.added or delta.removed:
+                try:
+                    im.apply_feed_delta(name, delta.added, delta.removed)
+                except im.IptablesError:
+                    # Base et noyau divergent (règles retirées à la main...) :
+                    # recalculer le delta d'après le noyau et réessayer une fois
+                    logger.warning("Flux %s : état iptables divergent, resynchronisation", name)
+                    kernel = feeds.diff(wanted, im.list_feed_rules(name))
+                    im.apply_feed_delta(name, kernel.added, kernel.removed)
+        except Exception as e:
+            record_feed_error(name, str(e))
+            metrics.inc("dynfw_feed_syncs_total", feed=name, status="error")
+            raise
+        applied = time.perf_counter()
+
+        stats = {
+            "feed": name,
+            "entries": delta.entries,
+            "added": len(delta.added),
+            "removed": len(delta.removed),
+            "allowlisted": len(skipped),
+            "parse_ms": round((parsed - start) * 1000, 3),
+            "apply_ms": round((applied - parsed) * 1000, 3),
+        }
+        stats["db_ms"] = store_feed_sync(name, delta, mtime, stats)
+
+    metrics.inc("dynfw_feed_syncs_total", feed=name, status="ok")
+    metrics.inc("dynfw_feed_rules_added_total", stats["added"], feed=name)
+    metrics.inc("dynfw_feed_rules_removed_total", stats["removed"], feed=name)
+    if skipped:
+        logger.warning("Flux %s : %d plage(s) exclue(s) (allowlist)", name, len(skipped))
+    logger.info("FEED_SYNC %s entries=%d +%d -%d (parse %.1f ms, iptables %.1f ms, db %.1f ms)",
+                name, stats["entries"], stats["added"], stats["removed"],
+                stats["parse_ms"], stats["apply_ms"], stats["db_ms"], extra=stats)
+    bus.publish("feed_sync", feed=name, added=stats["added"], removed=stats["removed"])
+    return stats
+
+def sync_feeds(force: bool = False) -> int:
+    """
+    Synchronise les flux dont le fichier a changé (tous avec `force`, ex.
+    après une modification de l'allowlist) ; retourne le nombre de flux traités.
+    """
+    synced = 0
+    for feed in get_feeds():
+        try:
+            if sync_feed(feed["name"], force=force) is not None:
+                synced += 1
+        except Exception:
+            logger.exception("Échec de synchronisation du flux %s", feed["name"])
+    return synced
+
+_feeds_allow_generation = 0
+
+def sync_feeds_for_allowlist() -> int:
+    """
+    Si l'allowlist compilée a changé depuis la dernière synchro (API, fichier
+    rechargé à chaud, source externe), resynchronise tous les flux ; retourne
+    le nombre de flux traités.
+    """
+    global _feeds_allow_generation
+    allow.current()  # recharge le fichier si son mtime a changé
+    if allow.generation == _feeds_allow_generation:
+        return 0
+    _feeds_allow_generation = allow.generation
+    return sync_feeds(force=True)
+
+def expire_blocks() -> int:
+    """Retire du firewall et de la base les blocs dont le TTL est écoulé."""
+    expired = get_expired_ips(int(time.time()))
+    for ip in expired:
+        try:
+            im.unblock_ip(ip)
+        except Exception:
+            logger.exception("Échec du retrait iptables pour %s expiré", ip)
+        remove_db_block(ip)
+        bus.publish("expire", ip=ip)
+    if expired:
+        logger.info(f"{len(expired)} bloc(s) expiré(s)")
+    return len(expired)
+
+def collect_counters() -> int:
+    """Relève les compteurs noyau (une seule commande) et les historise."""
+    return store_counters(im.read_counters(), int(time.time()))
+
+def prune_cold_blocks() -> int:
+    """Applique PRUNE_ACTION aux blocs sans hit depuis PRUNE_IDLE secondes."""
+    if not PRUNE_IDLE:
+        return 0
+    now = int(time.time())
+    cold = get_cold_blocks(now - PRUNE_IDLE)
+
+    if PRUNE_ACTION == "remove":
+        for ip, _ in cold:
+            try:
+                im.unblock_ip(ip)
+            except Exception:
+                logger.exception("Échec du retrait iptables pour %s (froid)", ip)
+            remove_db_block(ip)
+            bus.publish("prune", ip=ip)
+        pruned = [ip for ip, _ in cold]
+    else:
+        # demote : ne raccourcit que les blocs permanents ou plus longs que le TTL réduit
+        expires_at = now + PRUNE_DEMOTE_TTL
+        pruned = [ip for ip, exp in cold if exp is None or exp > expires_at]
+        set_db_expiry(pruned, expires_at)
+        for ip in pruned:
+            bus.publish("demote", ip=ip, expires_at=expires_at)
+
+    if pruned:
+        logger.info(f"{len(pruned)} bloc(s) froid(s) élagué(s) ({PRUNE_ACTION})")
+    return len(pruned)
+
+def _maintenance_loop():
+    last_counters = 0.0
+    last_feeds = 0.0
+    while not _maintenance_stop.wait(EXPIRE_INTERVAL):
+        try:
+            with _write_lock:
+                expire_blocks()
+                purge_offenses(int(time.time()) - OFFENSE_RETENTION)
+                sync_feeds_for_allowlist()
+            if FEED_INTERVAL and time.time() - last_feeds >= FEED_INTERVAL:
+                last_feeds = time.time()
+                with _write_lock:
+                    sync_feeds()
+            if COUNTERS_INTERVAL and time.time() - last_counters >= COUNTERS_INTERVAL:
+                last_counters = time.time()
+                with _write_lock:
+                    collect_counters()
+                    prune_cold_blocks()
+        except Exception:
+            logger.exception("Erreur maintenance")
+
+def _format_event(event: dict, fmt: str) -> str:
+    if fmt == "ndjson":
+        return json.dumps(event) + "\n"
+    head = f"id: {event['id']}\n" if "id" in event else ""
+    return f"{head}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+async def _event_stream(request: Request, sub: event_bus.Subscriber, fmt: str):
+    keepalive = "\n" if fmt == "ndjson" else ": keepalive\n\n"
+    try:
+        while not await request.is_disconnected():
+            dropped, events = sub.drain()
+            if dropped:
+                # Le client doit resynchroniser via /list
+                yield _format_event({"type": "dropped", "count": dropped}, fmt)
+            for event in events:
+                yield _format_event(event, fmt)
+            if dropped or events:
+                continue
+            try:
+                await asyncio.wait_for(sub.wait(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield keepalive
+    finally:
+        bus.unsubscribe(sub)
+
+# ---------------------------------------------------------
+# ÉCRITURES (exécutées par le leader uniquement)
+# ---------------------------------------------------------
+def do_block(ip: str, port: Optional[int], reason: Optional[str], ttl_seconds: Optional[int]):
+    ensure_not_allowlisted(ip, source="api")
+    now = int(time.time())
+
+    # Décision, règle iptables et historique sous le verrou d'écriture : deux
+    # requêtes simultanées pour la même cible ne posent qu'une règle
+    with _write_lock:
+        state = block_state(ip, port, ttl_seconds, now)
+        if state["action"] == "duplicate":
+            # Déjà bloquée (même port, au moins aussi longtemps) : rien à faire
+            metrics.inc("dynfw_block_requests_total", outcome="duplicate")
+            return {"status": "blocked", "ip": ip, "expires_at": state["expires_at"],
+                    "duplicate": True}
+        if state["action"] == "extend":
+            # TTL plus long demandé : on repousse l'échéance, sans infraction
+            extend_db_block(ip, reason, state["expires_at"])
+            metrics.inc("dynfw_block_requests_total", outcome="extended")
+            logger.info("BLOCK_EXTEND target=%s expires_at=%s", ip, state["expires_at"])
+            bus.publish("block", ip=ip, port=port, reason=reason, expires_at=state["expires_at"])
+            return {"status": "blocked", "ip": ip, "expires_at": state["expires_at"],
+                    "duplicate": True, "extended": True}
+
+        ttl, prior, expires_at = state["ttl"], state["prior"], state["expires_at"]
+        unblocked = False
+        try:
+            if state["replaced"]:
+                im.unblock_ip(ip)  # port différent : remplacer la règle
+                unblocked = True
+            im.block_ip(ip, port=port, comment=reason or "dynfw")
+        except Exception:
+            # Pas de règle posée : aucune infraction enregistrée (un nouvel
+            # essai n'escalade pas le TTL) ; l'ancien bloc disparaît s'il a été retiré
+            if unblocked:
+                remove_db_block(ip)
+            raise
+        try:
+            record_block(ip, port, reason, now, ttl, expires_at)
+        except Exception:
+            # Règle sans entrée en base : elle n'expirerait jamais
+            im.unblock_ip(ip)
+            raise
+
+    if prior:
+        logger.warning("RECIDIVE target=%s prior=%d ttl=%s", ip, prior, ttl or "permanent",
+                       extra={"target": ip, "prior": prior, "ttl": ttl})
+    metrics.inc("dynfw_block_requests_total",
+                outcome="recidive" if prior else "new")
+    bus.publish("block", ip=ip, port=port, reason=reason, expires_at=expires_at,
+                offenses=prior + 1)
+
+    return {"status": "blocked", "ip": ip, "expires_at": expires_at,
+            "ttl_seconds": ttl, "recent_offenses": prior + 1}
+
+def do_unblock(ip: str):
+    im.unblock_ip(ip)
+    remove_db_block(ip)
+    bus.publish("unblock", ip=ip)
+    return {"status": "unblocked", "ip": ip}
+
+def do_feed_add(name: str, path: str, reason: Optional[str]):
+    if not feeds.valid_name(name):
+        raise HTTPException(status_code=422, detail="Nom de flux invalide ([A-Za-z0-9_.-], 64 max)")
+    path = os.path.realpath(path)
+    if os.path.commonpath([FEED_DIR, path]) != FEED_DIR:
+        raise HTTPException(status_code=403, detail=f"Le fichier doit être sous {FEED_DIR}")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=400, detail=f"Fichier introuvable: {path}")
+    add_db_feed(name, path, reason)
+    logger.info("FEED_ADD %s path=%s", name, path)
+    return {"status": "registered", "sync": do_feed_sync(name)}
+
+def do_feed_sync(name: str):
+    try:
+        return sync_feed(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Flux inconnu: {name}")
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"Lecture du flux impossible: {e}")
+    except im.IptablesError as e:
+        raise HTTPException(status_code=500, detail=f"Échec iptables: {e}")
+
+def do_feed_remove(name: str):
+    """Retire toutes les règles du flux (une transaction) puis l'oublie."""
+    if get_feed(name) is None:
+        raise HTTPException(status_code=404, detail=f"Flux inconnu: {name}")
+    with _feed_lock:
+        applied = get_feed_entries(name)
+        if applied:
+            try:
+                im.apply_feed_delta(name, (), applied)
+            except im.IptablesError as e:
+                raise HTTPException(status_code=500, detail=f"Échec iptables: {e}")
+        remove_db_feed(name)
+    logger.info("FEED_REMOVE %s (%d règle(s) retirée(s))", name, len(applied))
+    bus.publish("feed_sync", feed=name, added=0, removed=len(applied))
+    return {"status": "removed", "name": name, "removed": len(applied)}
+
+def do_allow_add(cidr: str, comment: Optional[str]):
+    add_db_allow(cidr, comment)
+    allow.reload()
+    logger.info("ALLOWLIST_ADD %s", cidr)
+    bus.publish("allowlist", cidr=cidr, action="add")
+    # Les flux déjà appliqués peuvent couvrir le nouveau réseau
+    return {"status": "allowed", "cidr": cidr, "feeds_resynced": sync_feeds_for_allowlist()}
+
+def do_allow_remove(cidr: str):
+    if not remove_db_allow(cidr):
+        raise HTTPException(status_code=404, detail=f"{cidr} absent de l'allowlist (base)")
+    allow.reload()
+    logger.info("ALLOWLIST_REMOVE %s", cidr)
+    bus.publish("allowlist", cidr=cidr, action="remove")
+    # Les parties de flux exclues jusque-là redeviennent applicables
+    return {"status": "removed", "cidr": cidr, "feeds_resynced": sync_feeds_for_allowlist()}
+
+def render_metrics() -> str:
+    log_stats = dynfw_logging.stats()
+    return metrics.render({
+        "dynfw_log_queue_dropped_total": log_stats["queue_dropped"],
+        "dynfw_log_rate_suppressed_total": log_stats["rate_suppressed"],
+        "dynfw_allowlist_networks": allow.current().size,
+        "dynfw_events_subscribers": bus.subscriber_count,
+    })
+
+LEADER_OPS = {
+    "block": do_block,
+    "unblock": do_unblock,
+    "feed_add": do_feed_add,
+    "feed_sync": do_feed_sync,
+    "feed_remove": do_feed_remove,
+    "allow_add": do_allow_add,
+    "allow_remove": do_allow_remove,
+    "metrics": render_metrics,
+}
+
+# ---------------------------------------------------------
+# MULTI-WORKERS (LEADER)
+# ---------------------------------------------------------
+leader_lock = leader.LeaderLock(LEADER_LOCK)
+rpc = leader.RpcClient(LEADER_SOCKET, API_TOKEN.encode())
+_rpc_server: Optional[leader.RpcServer] = None
+_stopping = threading.Event()
+
+def _rpc_error_status(e: Exception):
+    """Erreurs HTTP du leader renvoyées telles quelles au worker appelant."""
+    if isinstance(e, HTTPException):
+        return e.status_code, e.detail
+    return None
+
+def leader_call(op: str, **kwargs):
+    """Exécute `op` ici si ce worker est leader, sinon chez le leader."""
+    if leader_lock.held:
+        with _write_lock:
+            return LEADER_OPS[op](**kwargs)
+    try:
+        return rpc.call(op, **kwargs)
+    except leader.RemoteError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except (EOFError, OSError):
+        raise HTTPException(status_code=503, detail="Leader indisponible, réessayer")
+
+def become_leader():
+    """Verrou acquis : prend en charge iptables, la maintenance et le RPC."""
+    global _rpc_server
+    init_db()
+    allow.reload()
+    im.ensure_chain()
+    if im.ensure_chain(im.FEED_CHAIN):
+        reset_feed_entries()
+    bus.start_epoch()
+    _maintenance_stop.clear()
+    threading.Thread(target=_maintenance_loop, name="dynfw-maintenance", daemon=True).start()
+    _rpc_server = leader.RpcServer(LEADER_SOCKET, API_TOKEN.encode(), LEADER_OPS,
+                                   _rpc_error_status, events_source=bus, lock=_write_lock)
+    _rpc_server.start()
+    logger.info("Worker %d leader (verrou %s)", os.getpid(), LEADER_LOCK)
+
+def _follower_loop():
+    """
+    Worker non leader : rediffuse le flux d'événements du leader et reprend
+    le verrou dès que le leader disparaît (connexion coupée).
+    """
+    while not _stopping.is_set():
+        if leader_lock.try_acquire():
+            try:
+                become_leader()
+                return
+            except Exception:
+                # Laisser la place à un autre worker plutôt que garder un verrou inutile
+                logger.exception("Échec de la prise de rôle de leader")
+                _maintenance_stop.set()
+                leader_lock.release()
+                _stopping.wait(LEADER_RETRY)
+                continue
+        conn = None
+        try:
+            conn = rpc.connect()
+            conn.send(("events", {}))
+            _, first_id, last_id, replay = conn.recv()
+            bus.reset(first_id, last_id, replay)
+            allow.reload()
+            while not _stopping.is_set():
+                message = conn.recv()
+                if message[0] != "event":
+                    continue
+                bus.relay(message[1])
+                if message[1]["type"] == "allowlist":
+                    allow.reload()
+        except (EOFError, OSError):
+            pass
+        except Exception:
+            logger.exception("Relais des événements du leader interrompu")
+        finally:
+            if conn is not None:
+                conn.close()
+        _stopping.wait(LEADER_RETRY)
 
 # ---------------------------------------------------------
 # ROUTES
 # ---------------------------------------------------------
 @app.on_event("startup")
 def startup():
-    init_db()
-    im.ensure_chain()
+    _stopping.clear()
+    if leader_lock.try_acquire():
+        become_leader()
+    else:
+        logger.info("Worker %d : écritures transmises au leader (%s)", os.getpid(), LEADER_SOCKET)
+        threading.Thread(target=_follower_loop, name="dynfw-follower", daemon=True).start()
     logger.info("API DynFW démarrée")
 
+@app.on_event("shutdown")
+def shutdown():
+    _stopping.set()
+    _maintenance_stop.set()
+    if _rpc_server is not None:
+        _rpc_server.stop()
+    leader_lock.release()
+
 @app.post("/block", dependencies=[Depends(check_token)])
 def block(r: BlockReq, request: Request):
-    ip = str(r.ip)
+    ip = target_of(r.ip)
     src_ip = request.client.host if request.client else "unknown"
 
-    logger.warning(f"BLOCK_REQUEST from {src_ip} target={ip}")
-
-    im.block_ip(ip, port=r.port, comment=r.reason or "dynfw")
-    add_db_block(ip, r.reason, r.ttl_seconds, port=r.port)
-
-    return {"status": "blocked", "ip": ip}
+    logger.warning("BLOCK_REQUEST from %s target=%s", src_ip, ip,
+                   extra={"client_ip": src_ip, "target": ip})
+    return leader_call("block", ip=ip, port=r.port, reason=r.reason, ttl_seconds=r.ttl_seconds)
 
 @app.post("/unblock", dependencies=[Depends(check_token)])
 def unblock(r: UnblockReq, request: Request):
-    ip = str(r.ip)
+    ip = target_of(r.ip)
     src_ip = request.client.host if request.client else "unknown"
 
-    logger.info(f"UNBLOCK_REQUEST from {src_ip} target={ip}")
-
-    im.unblock_ip(ip)
-    remove_db_block(ip)
-
-    return {"status": "unblocked", "ip": ip}
+    logger.info("UNBLOCK_REQUEST from %s target=%s", src_ip, ip,
+                extra={"client_ip": src_ip, "target": ip})
+    return leader_call("unblock", ip=ip)
 
 @app.get("/list", dependencies=[Depends(check_token)])
-def list_blocks():
-    blocks = get_blocks()
+def list_blocks(cidr: Optional[str] = None, ip: Optional[str] = None):
+    """
+    - cidr : ne retourne que les blocs contenus dans ce réseau
+    - ip   : ne retourne que les blocs qui couvrent cette adresse
+    """
+    try:
+        if cidr:
+            blocks = get_blocks_in(ip_codec.parse_target(cidr, strict=False))
+        elif ip:
+            blocks = get_blocks_covering(ipaddress.ip_address(ip))
+        else:
+            blocks = get_blocks()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Filtre invalide: {e}")
     return {"blocks": blocks, "count": len(blocks)}
 
+@app.get("/stats", dependencies=[Depends(check_token)])
+def list_stats(limit: int = 100, cold: bool = False):
+    """
+    Hits noyau par bloc (dernier relevé des compteurs iptables).
+    - cold : ne retourne que les blocs sans aucun hit relevé
+    """
+    stats = get_hit_summary(limit=limit, cold_only=cold)
+    return {"stats": stats, "count": len(stats)}
+
+@app.get("/stats/{ip:path}", dependencies=[Depends(check_token)])
+def block_stats(ip: str, since: Optional[int] = None):
+    """Historique des hits d'un bloc par tranche de DYNFW_STATS_BUCKET secondes."""
+    target = target_of(ip)
+    if since is None:
+        since = int(time.time()) - STATS_RETENTION
+    return {"ip": target, "bucket_seconds": STATS_BUCKET, "buckets": get_block_stats(target, since)}
+
+@app.get("/offenders", dependencies=[Depends(check_token)])
+def list_offenders(limit: int = 100, since: Optional[int] = None):
+    """
+    Cibles classées par nombre de blocages.
+    - since : ne retourne que les cibles bloquées depuis ce timestamp
+    """
+    offenders = get_offenders(limit=limit, since=since)
+    return {"offenders": offenders, "count": len(offenders)}
+
+@app.get("/offenders/{ip:path}", dependencies=[Depends(check_token)])
+def offender_history(ip: str, base_ttl: Optional[int] = None):
+    """
+    Historique des blocages d'une cible (DYNFW_OFFENSE_RETENTION secondes).
+    - base_ttl : TTL demandé, pour connaître le TTL du prochain blocage
+    """
+    target = target_of(ip)
+    history = get_offense_history(target)
+    cutoff = int(time.time()) - RECIDIVE_LOOKBACK
+    recent = sum(1 for h in history if h["ts"] > cutoff)
+    result = {
+        "ip": target,
+        "history": history,
+        "recent_offenses": recent,
+        "lookback_seconds": RECIDIVE_LOOKBACK,
+        "block": get_block(target),
+    }
+    if base_ttl is not None:
+        result["next_ttl"] = recidive_ttl(base_ttl, recent)
+    return result
+
+@app.get("/events", dependencies=[Depends(check_token)])
+async def events(request: Request, format: str = "sse", last_id: Optional[int] = None):
+    """
+    Flux des événements block / unblock / expire.
+    - format  : "sse" (text/event-stream) ou "ndjson"
+    - last_id : reprise après cet id (ou en-tête Last-Event-ID)
+    """
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="format: sse ou ndjson")
+    header_id = request.headers.get("Last-Event-ID")
+    if last_id is None and header_id and header_id.isdigit():
+        last_id = int(header_id)
+
+    sub = bus.subscribe(last_id)
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(
+        _event_stream(request, sub, format),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/feeds", dependencies=[Depends(check_token)])
+def list_feeds():
+    feed_list = get_feeds()
+    return {"feeds": feed_list, "count": len(feed_list)}
+
+@app.post("/feeds", dependencies=[Depends(check_token)])
+def add_feed(r: FeedReq):
+    """Enregistre (ou met à jour) un flux local et le synchronise immédiatement."""
+    return leader_call("feed_add", name=r.name, path=r.path, reason=r.reason)
+
+@app.post("/feeds/remove", dependencies=[Depends(check_token)])
+def remove_feed(r: FeedNameReq):
+    return leader_call("feed_remove", name=r.name)
+
+@app.post("/feeds/{name}/sync", dependencies=[Depends(check_token)])
+def force_feed_sync(name: str):
+    return leader_call("feed_sync", name=name)
+
+@app.get("/feeds/{name}/syncs", dependencies=[Depends(check_token)])
+def feed_syncs(name: str, limit: int = 20):
+    """Historique des synchros : tailles des deltas et durées (parse / iptables / base)."""
+    if get_feed(name) is None:
+        raise HTTPException(status_code=404, detail=f"Flux inconnu: {name}")
+    return {"feed": name, "syncs": get_feed_syncs(name, limit)}
+
+@app.get("/allowlist", dependencies=[Depends(check_token)])
+def list_allowlist():
+    entries = get_allowlist_entries()
+    return {
+        "entries": entries,
+        "file": allow.path or None,
+        "compiled_networks": allow.current().size,
+    }
+
+@app.get("/allowlist/check", dependencies=[Depends(check_token)])
+def check_allowlist(ip: str):
+    """Indique si une adresse ou un CIDR chevauche l'allowlist (fichier + base)."""
+    try:
+        target = ip_codec.parse_target(ip, strict=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Cible invalide: {e}")
+    match = allow.match(target)
+    return {"ip": ip, "allowlisted": match is not None, "match": str(match) if match else None}
+
+@app.post("/allowlist", dependencies=[Depends(check_token)])
+def add_allowlist(r: AllowReq):
+    return leader_call("allow_add", cidr=target_of(r.cidr), comment=r.comment)
+
+@app.post("/allowlist/remove", dependencies=[Depends(check_token)])
+def remove_allowlist(r: AllowReq):
+    return leader_call("allow_remove", cidr=target_of(r.cidr))
+
+@app.get("/metrics", dependencies=[Depends(check_token)], response_class=PlainTextResponse)
+def get_metrics():
+    """Compteurs du leader (blocages, flux, allowlist), quel que soit le worker interrogé."""
+    return leader_call("metrics")
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "timestamp": int(time.time())}
@@ -221,4 +1363,8 @@ def list_clients():
 # ---------------------------------------------------------
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if API_WORKERS > 1:
+        # Chaque worker réimporte le module : l'application est désignée par son nom
+        uvicorn.run("firewall_api_improved:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -5,46 +5,62 @@ import subprocess
 import ipaddress
 import logging
 import shlex
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple, Iterable, Set
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+# Configuré par le point d'entrée (dynfw_logging.setup_logging)
 logger = logging.getLogger("iptables_manager")
 
 CHAIN = "DYN_BLOCK"
 TABLE = "filter"
 IPTABLES_CMD = "/usr/sbin/iptables"  # changer si iptables est ailleurs
+IP6TABLES_CMD = "/usr/sbin/ip6tables"
+RESTORE_CMDS = {4: "/usr/sbin/iptables-restore", 6: "/usr/sbin/ip6tables-restore"}
+FEED_CHAIN = "DYN_FEED"  # règles des flux de blocage (cf. apply_feed_delta)
 
 class IptablesError(Exception):
     pass
 
-def run_cmd(cmd: List[str]):
+def run_cmd(cmd: List[str], input: Optional[str] = None):
     """Exécuter la commande iptables avec gestion d'erreur."""
     logger.debug("Running: %s", " ".join(cmd))
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        subprocess.run(cmd, check=True, capture_output=True, text=True, input=input)
     except subprocess.CalledProcessError as e:
         logger.error("Command failed: %s", e.stderr or e)
         raise IptablesError(f"Failed to run: {' '.join(cmd)}")
 
-def ensure_chain():
-    """Créer la chaîne custom si elle n'existe pas et s'assurer qu'INPUT pointe vers elle."""
+def ensure_chain(chain: str = CHAIN, iptables: str = IPTABLES_CMD) -> bool:
+    """
+    Créer la chaîne custom si elle n'existe pas et s'assurer qu'INPUT pointe vers elle.
+    Retourne True si la chaîne vient d'être créée (donc vide).
+    """
+    created = False
     try:
-        run_cmd(["sudo", IPTABLES_CMD, "-t", TABLE, "-n", "-L", CHAIN])
-        logger.debug(f"Chain {CHAIN} exists")
+        run_cmd(["sudo", iptables, "-t", TABLE, "-n", "-L", chain])
+        logger.debug(f"Chain {chain} exists")
     except IptablesError:
-        logger.info(f"Creating chain {CHAIN}")
-        run_cmd(["sudo", IPTABLES_CMD, "-t", TABLE, "-N", CHAIN])
+        logger.info(f"Creating chain {chain}")
+        run_cmd(["sudo", iptables, "-t", TABLE, "-N", chain])
+        created = True
 
     # s'assurer que INPUT pointe vers la chaîne
-    out = subprocess.run(["sudo", IPTABLES_CMD, "-t", TABLE, "-C", "INPUT", "-j", CHAIN],
+    out = subprocess.run(["sudo", iptables, "-t", TABLE, "-C", "INPUT", "-j", chain],
                          capture_output=True, text=True)
     if out.returncode != 0:
-        logger.info(f"Inserting jump from INPUT to {CHAIN}")
-        run_cmd(["sudo", IPTABLES_CMD, "-t", TABLE, "-I", "INPUT", "1", "-j", CHAIN])
+        logger.info(f"Inserting jump from INPUT to {chain}")
+        run_cmd(["sudo", iptables, "-t", TABLE, "-I", "INPUT", "1", "-j", chain])
+    return created
+
+def _rule_source(parts: List[str]):
+    """Réseau source d'une règle `iptables -S` (None si absent ou invalide)."""
+    try:
+        return ipaddress.ip_network(parts[parts.index("-s") + 1])
+    except (ValueError, IndexError):
+        return None
 
 def block_ip(ip: str, port: Optional[int] = None, comment: Optional[str] = None):
-    """Bloquer une IP avec port optionnel et commentaire."""
-    ipaddress.ip_address(ip)
+    """Bloquer une IP ou un CIDR avec port optionnel et commentaire."""
+    ipaddress.ip_network(ip)
     ensure_chain()
     cmd = ["sudo", IPTABLES_CMD, "-t", TABLE, "-A", CHAIN, "-s", ip]
     if port:
@@ -53,29 +69,27 @@ def block_ip(ip: str, port: Optional[int] = None, comment: Optional[str] = None)
     if comment:
         cmd += ["-m", "comment", "--comment", comment[:255]]
     run_cmd(cmd)
-    logger.info(f"Blocked {ip}{' on port '+str(port) if port else ''}")
+    logger.info("Blocked %s%s", ip, f" on port {port}" if port else "")
 
 def unblock_ip(ip: str, port: Optional[int] = None):
-    """Débloquer une IP. Si port précisé, ne supprime que cette règle."""
-    ipaddress.ip_address(ip)
+    """Débloquer une IP ou un CIDR. Si port précisé, ne supprime que cette règle."""
+    target = ipaddress.ip_network(ip)
     result = subprocess.run(["sudo", IPTABLES_CMD, "-t", TABLE, "-S", CHAIN],
                             capture_output=True, text=True, check=True)
     lines = result.stdout.splitlines()
     deleted_count = 0
     for line in lines:
-        if f"-s {ip}" in line:
+        parts = shlex.split(line)
+        if parts and parts[0] == "-A" and _rule_source(parts) == target:
             if port and f"--dport {port}" not in line:
                 continue  # ne supprimer que si port correspond
-            parts = shlex.split(line)
-            if parts[0] != "-A":
-                continue
             parts[0] = "-D"
             cmd = ["sudo", IPTABLES_CMD, "-t", TABLE] + parts
             run_cmd(cmd)
             deleted_count += 1
-            logger.info(f"Unblocked rule: {' '.join(cmd)}")
+            logger.info("Unblocked rule: %s", " ".join(cmd))
     if deleted_count == 0:
-        logger.warning(f"No rule found for {ip}{' on port '+str(port) if port else ''}")
+        logger.warning("No rule found for %s%s", ip, f" on port {port}" if port else "")
 
 def list_blocked() -> List[str]:
     """Lister toutes les IPs bloquées (tous ports confondus)."""
@@ -83,17 +97,84 @@ def list_blocked() -> List[str]:
                             capture_output=True, text=True, check=True)
     ips = []
     for line in result.stdout.splitlines():
-        if "-s" in line:
-            parts = line.split()
-            try:
-                idx = parts.index("-s")
-                ip = parts[idx + 1]
-                ipaddress.ip_address(ip)
-                ips.append(ip)
-            except Exception:
-                continue
+        net = _rule_source(line.split())
+        if net is None:
+            continue
+        # iptables -S affiche les hôtes en /32 : revenir à l'adresse seule
+        ips.append(str(net.network_address) if net.prefixlen == net.max_prefixlen else str(net))
     return ips
 
+def read_counters() -> Dict[str, Tuple[int, int]]:
+    """
+    Compteurs noyau (paquets, octets) par source, en une seule lecture
+    `iptables -S CHAIN -v` (`-c <paquets> <octets>` sur chaque règle). Les
+    règles d'une même source (ports différents) sont additionnées.
+    Clé : adresse seule pour un hôte, CIDR sinon.
+    """
+    result = subprocess.run(["sudo", IPTABLES_CMD, "-t", TABLE, "-S", CHAIN, "-v"],
+                            capture_output=True, text=True, check=True)
+    counters = {}
+    for line in result.stdout.splitlines():
+        parts = shlex.split(line)
+        if not parts or parts[0] != "-A" or "-c" not in parts:
+            continue
+        net = _rule_source(parts)
+        if net is None:
+            continue
+        try:
+            i = parts.index("-c")
+            pkts, nbytes = int(parts[i + 1]), int(parts[i + 2])
+        except (ValueError, IndexError):
+            continue
+        key = str(net.network_address) if net.prefixlen == net.max_prefixlen else str(net)
+        prev_pkts, prev_bytes = counters.get(key, (0, 0))
+        counters[key] = (prev_pkts + pkts, prev_bytes + nbytes)
+    return counters
+
+def _feed_rule(target: str, feed: str) -> str:
+    return f"{target} -m comment --comment feed:{feed} -j DROP"
+
+def apply_feed_delta(feed: str, added: Iterable[str], removed: Iterable[str], chain: str = FEED_CHAIN):
+    """
+    Applique le delta d'un flux en une transaction par famille :
+    `iptables-restore --noflush` charge toutes les règles d'un coup
+    (un seul commit de la table au lieu d'un appel iptables par règle)
+    et n'applique rien si une ligne échoue. Chaque règle porte le
+    commentaire `feed:<nom>` : les retraits ne touchent que ce flux.
+    """
+    by_family: Dict[int, List[str]] = {}
+    for op, targets in (("-D", removed), ("-A", added)):
+        for target in targets:
+            family = ipaddress.ip_network(target).version
+            by_family.setdefault(family, []).append(f"{op} {chain} -s {_feed_rule(target, feed)}")
+
+    for family, rules in sorted(by_family.items()):
+        if family == 6:
+            ensure_chain(chain, IP6TABLES_CMD)
+        script = f"*{TABLE}\n" + "\n".join(rules) + "\nCOMMIT\n"
+        run_cmd(["sudo", RESTORE_CMDS[family], "--noflush"], input=script)
+        logger.info("Feed %s: %d rule change(s) applied (IPv%d)", feed, len(rules), family)
+
+def list_feed_rules(feed: str, chain: str = FEED_CHAIN) -> Set[str]:
+    """Cibles réellement présentes dans le noyau pour un flux (IPv4 et IPv6)."""
+    marker = f"feed:{feed}"
+    targets = set()
+    for iptables in (IPTABLES_CMD, IP6TABLES_CMD):
+        result = subprocess.run(["sudo", iptables, "-t", TABLE, "-S", chain],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            continue  # chaîne absente (ex. IPv6 jamais utilisé)
+        for line in result.stdout.splitlines():
+            parts = shlex.split(line)
+            if marker not in parts:
+                continue
+            net = _rule_source(parts)
+            if net is not None:
+                targets.add(str(net.network_address) if net.prefixlen == net.max_prefixlen else str(net))
+    return targets
+
 if __name__ == "__main__":
+    import dynfw_logging
+    dynfw_logging.setup_logging("manager", json_file=False)
     ensure_chain()
     print(f"IPs bloquées ({len(list_blocked())}): {list_blocked()}")
@@ -7,10 +7,7 @@ import logging
 import shlex
 from typing import Optional, List
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configuré par le point d'entrée (dynfw_logging.setup_logging)
 logger = logging.getLogger("iptables_manager")
 
 CHAIN = "DYN_BLOCK"
@@ -73,7 +70,7 @@ def block_ip(ip: str, port: Optional[int] = None, comment: Optional[str] = None)
         cmd += ["-m", "comment", "--comment", str(comment)[:255]]
     
     run_cmd(cmd)
-    logger.info(f"IP {ip} bloquée{' sur le port ' + str(port) if port else ''}")
+    logger.info("IP %s bloquée%s", ip, f" sur le port {port}" if port else "")
 
 def unblock_ip(ip: str, port: Optional[int] = None) -> None:
     """Débloquer une adresse IP avec port optionnel."""
@@ -135,6 +132,8 @@ def list_blocked() -> List[str]:
         return []
 
 if __name__ == "__main__":
+    import dynfw_logging
+    dynfw_logging.setup_logging("manager", json_file=False)
     try:
         ensure_chain()
         blocked_ips = list_blocked()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# ip_codec.py - Encodage binaire des adresses/réseaux pour la table blocks
+#
+# Chaque cible est stockée sous forme (family, addr, prefixlen) :
+#   family    : 4 ou 6
+#   addr      : adresse réseau sur 16 octets big-endian (IPv4 paddé à gauche)
+#   prefixlen : 32/128 pour une adresse seule
+# L'ordre des octets suit l'ordre numérique : les requêtes de plage sur
+# l'index (family, addr, prefixlen) deviennent de simples BETWEEN.
+
+import ipaddress
+from typing import Dict, Tuple, Union
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+ADDR_LEN = 16
+
+
+def parse_target(value, strict: bool = True) -> IPNetwork:
+    """Adresse ou CIDR -> réseau (1.2.3.4 -> 1.2.3.4/32). Lève ValueError."""
+    return ipaddress.ip_network(str(value).strip(), strict=strict)
+
+
+def target_str(net: IPNetwork) -> str:
+    """Forme texte canonique : adresse seule pour un hôte, CIDR sinon."""
+    if net.prefixlen == net.max_prefixlen:
+        return str(net.network_address)
+    return str(net)
+
+
+def pack(addr: IPAddress) -> bytes:
+    return int(addr).to_bytes(ADDR_LEN, "big")
+
+
+def encode(net: IPNetwork) -> Tuple[int, bytes, int]:
+    """Réseau -> (family, addr, prefixlen) tel que stocké en base."""
+    return net.version, pack(net.network_address), net.prefixlen
+
+
+def bounds(net: IPNetwork) -> Tuple[int, bytes, bytes]:
+    """Réseau -> (family, première adresse, dernière adresse) pour un BETWEEN."""
+    return net.version, pack(net.network_address), pack(net.broadcast_address)
+
+
+def covering_keys(addr: IPAddress) -> Dict[int, bytes]:
+    """
+    Pour chaque longueur de préfixe, l'adresse réseau qui contiendrait `addr`
+    (33 clés en IPv4, 129 en IPv6). Un bloc (addr, prefixlen) couvre `addr`
+    si et seulement si keys[prefixlen] == addr.
+    """
+    bits = addr.max_prefixlen
+    value = int(addr)
+    keys = {}
+    for prefixlen in range(bits + 1):
+        mask = ((1 << prefixlen) - 1) << (bits - prefixlen)
+        keys[prefixlen] = (value & mask).to_bytes(ADDR_LEN, "big")
+    return keys
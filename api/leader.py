@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# leader.py - Élection d'un leader entre workers de l'API et RPC local
+#
+# Un seul processus détient le verrou (flock sur un fichier, libéré par le
+# noyau à la mort du processus) : c'est lui qui touche iptables, lance la
+# maintenance et publie les événements. Les autres workers lui transmettent
+# les écritures par un socket Unix authentifié (multiprocessing.connection)
+# et rediffusent localement son flux d'événements.
+
+import fcntl
+import logging
+import os
+import queue
+import threading
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("leader")
+
+EVENTS_QUEUE_SIZE = 4096
+PING_INTERVAL = 15
+
+
+class LeaderLock:
+    """Verrou exclusif non bloquant ; tenu tant que le processus vit."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class RemoteError(Exception):
+    """Erreur levée par le leader, transmise telle quelle au worker appelant."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class RpcServer:
+    """
+    Côté leader : exécute `handlers[op](**kwargs)` pour chaque requête, sous
+    `lock` (partagé avec les écritures locales du leader : une connexion = un
+    thread, les handlers ne sont pas réentrants).
+    L'op spéciale "events" transforme la connexion en flux : (epoch, ...) puis
+    un ("event", dict) par événement publié, ("ping",) en l'absence d'activité.
+    """
+
+    def __init__(self, address: str, authkey: bytes, handlers: Dict[str, Callable],
+                 error_status: Callable[[Exception], Optional[tuple]], events_source=None,
+                 lock=None):
+        self.address = address
+        self.authkey = authkey
+        self.handlers = handlers
+        self.lock = lock if lock is not None else threading.Lock()
+        self.error_status = error_status
+        self.events_source = events_source
+        self._listener: Optional[Listener] = None
+
+    def start(self) -> None:
+        # Le verrou garantit qu'aucun autre leader n'utilise ce socket
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        threading.Thread(target=self._accept_loop, name="dynfw-rpc", daemon=True).start()
+        logger.info("RPC leader à l'écoute sur %s", self.address)
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _accept_loop(self) -> None:
+        listener = self._listener
+        while self._listener is listener:
+            try:
+                conn = listener.accept()
+            except Exception:
+                if self._listener is not listener:
+                    return
+                logger.exception("RPC : connexion refusée")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        try:
+            while True:
+                op, kwargs = conn.recv()
+                if op == "events":
+                    self._stream_events(conn)
+                    return
+                conn.send(self._call(op, kwargs))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _call(self, op: str, kwargs: dict) -> tuple:
+        handler = self.handlers.get(op)
+        if handler is None:
+            return ("error", 400, f"Opération inconnue: {op}")
+        try:
+            with self.lock:
+                return ("ok", handler(**kwargs))
+        except Exception as e:
+            status = self.error_status(e)
+            if status is None:
+                logger.exception("RPC : échec de %s", op)
+                return ("error", 500, str(e))
+            return ("error",) + status
+
+    def _stream_events(self, conn: Connection) -> None:
+        events: "queue.Queue" = queue.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        overflow = threading.Event()
+
+        def push(event: dict) -> None:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                overflow.set()
+
+        # Abonnement avant la photo de l'historique : un événement peut être
+        # reçu deux fois (dédoublonné par id côté worker), jamais perdu
+        self.events_source.add_listener(push)
+        try:
+            conn.send(("epoch",) + self.events_source.snapshot())
+            while not overflow.is_set():
+                try:
+                    conn.send(("event", events.get(timeout=PING_INTERVAL)))
+                except queue.Empty:
+                    conn.send(("ping",))
+            # Worker trop lent : il se reconnectera et signalera la perte
+        finally:
+            self.events_source.remove_listener(push)
+
+
+class RpcClient:
+    """Côté worker : une connexion par thread, reconnectée au besoin."""
+
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def connect(self) -> Connection:
+        return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    def call(self, op: str, **kwargs):
+        """
+        Reconnexion unique si la requête n'a pas pu partir (leader redémarré
+        ou remplacé). Une coupure après l'envoi remonte telle quelle : le
+        leader a pu exécuter l'opération, la renvoyer la doublerait.
+        """
+        for attempt in (1, 2):
+            conn = getattr(self._local, "conn", None)
+            try:
+                if conn is None:
+                    conn = self._local.conn = self.connect()
+                conn.send((op, kwargs))
+                break
+            except (EOFError, OSError):
+                self._local.conn = None
+                if attempt == 2:
+                    raise
+        try:
+            reply = conn.recv()
+        except (EOFError, OSError):
+            self._local.conn = None
+            raise
+        if reply[0] == "ok":
+            return reply[1]
+        raise RemoteError(reply[1], reply[2])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# learner_state.py - Checkpoint binaire de l'état de l'auto-learner
+#
+# Format (little-endian) :
+#   en-tête   : magic "DFWC", version, inode, offset, last_event_id,
+#               saved_at, nb tentatives, nb bloquées
+#   tentative : longueur IP (4/16), nb, IP brute, nb × âge (float32, s)
+#   bloquée   : longueur IP (4/16), IP brute, blocked_at (float64)
+# Les âges sont relatifs à saved_at : 4 octets par tentative suffisent.
+# L'écriture passe par un fichier temporaire + os.replace (atomique).
+
+import ipaddress
+import os
+import struct
+import time
+from collections import deque
+from typing import Dict, NamedTuple, Optional
+
+MAGIC = b"DFWC"
+VERSION = 1
+HEADER = struct.Struct("<4sBQQQdII")
+ATTEMPT = struct.Struct("<BH")
+BLOCKED = struct.Struct("<B")
+BLOCKED_AT = struct.Struct("<d")
+MAX_ATTEMPTS_PER_IP = 0xFFFF
+
+
+class Checkpoint(NamedTuple):
+    attempts: Dict[str, deque]
+    blocked: Dict[str, float]
+    inode: int
+    offset: int
+    last_event_id: int
+    saved_at: float
+
+
+def save(path: str, attempts: dict, blocked: dict, inode: int = 0, offset: int = 0,
+         last_event_id: int = 0, now: Optional[float] = None) -> int:
+    """Écrit le checkpoint de façon atomique ; retourne sa taille en octets."""
+    now = time.time() if now is None else now
+    body = bytearray()
+
+    n_attempts = 0
+    for ip, times in list(attempts.items()):
+        times = list(times)[-MAX_ATTEMPTS_PER_IP:]
+        if not times:
+            continue
+        packed = ipaddress.ip_address(ip).packed
+        body += ATTEMPT.pack(len(packed), len(times)) + packed
+        body += struct.pack(f"<{len(times)}f", *(now - t for t in times))
+        n_attempts += 1
+
+    n_blocked = 0
+    for ip, blocked_at in list(blocked.items()):
+        try:
+            packed = ipaddress.ip_address(ip).packed
+        except ValueError:
+            continue  # CIDR appris via l'API : inutile pour la déduplication par IP
+        body += BLOCKED.pack(len(packed)) + packed + BLOCKED_AT.pack(blocked_at)
+        n_blocked += 1
+
+    header = HEADER.pack(MAGIC, VERSION, inode, offset, last_event_id, now, n_attempts, n_blocked)
+    tmp = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(header) + len(body)
+
+
+def load(path: str, window: float, block_ttl: float, now: Optional[float] = None) -> Optional[Checkpoint]:
+    """
+    Relit un checkpoint en élaguant au passage les tentatives sorties de la
+    fenêtre et les blocages dont le TTL est écoulé. None si absent ou illisible.
+    """
+    now = time.time() if now is None else now
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, inode, offset, last_event_id, saved_at, n_attempts, n_blocked = \
+            HEADER.unpack_from(data, 0)
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    pos = HEADER.size
+    attempts = {}
+    blocked = {}
+    try:
+        for _ in range(n_attempts):
+            length, count = ATTEMPT.unpack_from(data, pos)
+            pos += ATTEMPT.size
+            ip = str(ipaddress.ip_address(data[pos:pos + length]))
+            pos += length
+            ages = struct.unpack_from(f"<{count}f", data, pos)
+            pos += 4 * count
+            times = deque(t for t in (saved_at - age for age in ages) if t >= now - window)
+            if times:
+                attempts[ip] = times
+
+        for _ in range(n_blocked):
+            (length,) = BLOCKED.unpack_from(data, pos)
+            pos += BLOCKED.size
+            ip = str(ipaddress.ip_address(data[pos:pos + length]))
+            pos += length
+            (blocked_at,) = BLOCKED_AT.unpack_from(data, pos)
+            pos += BLOCKED_AT.size
+            if blocked_at + block_ttl > now:
+                blocked[ip] = blocked_at
+    except (struct.error, ValueError):
+        return None
+
+    return Checkpoint(attempts, blocked, inode, offset, last_event_id, saved_at)
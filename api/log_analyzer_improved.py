@@ -3,20 +3,28 @@
 
 import time
 import re
+import json
+import threading
 import requests
 import ipaddress
 import logging
+import dynfw_logging
+import allowlist
+import learner_state
 import sys
 import os
+import zlib
+import multiprocessing as mp
+import queue
+import signal
 from collections import defaultdict, deque
+from functools import partial
+from typing import Callable, Iterable, Optional
 
 # ---------------------------------------------------------
 # LOGGING
 # ---------------------------------------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Configuré dans main() (dynfw_logging.setup_logging)
 logger = logging.getLogger("auto_learner")
 
 # ---------------------------------------------------------
@@ -32,12 +40,35 @@ THRESHOLD = int(os.environ.get("DYNFW_THRESHOLD", "5"))
 WINDOW = int(os.environ.get("DYNFW_WINDOW", "300"))
 BLOCK_TTL = int(os.environ.get("DYNFW_BLOCK_TTL", "7200"))
 REQUEST_TIMEOUT = 5
+# 429 de l'API : un Retry-After court est attendu puis l'envoi retenté une
+# fois ; au-delà, aucun envoi avant l'échéance (la fenêtre de l'IP est
+# conservée, la détection sera renvoyée à la tentative suivante)
+RETRY_AFTER_MAX_WAIT = 2.0
+api_backoff = {"until": 0.0}
+
+# Mode parallèle : 1 = boucle mono-thread historique
+WORKERS = int(os.environ.get("DYNFW_WORKERS", "1"))
+CHUNK_LINES = int(os.environ.get("DYNFW_CHUNK_LINES", "512"))
+WORKER_POLL = 1.0  # s : attente max. sur les détections avant de vérifier les processus
+DETECT_RETRY = 5.0  # s : délai avant de resignaler une IP dont le blocage n'est pas confirmé
+
+# Base de l'API (ex. http://127.0.0.1:8000) pour les autres routes
+API_BASE = API_URL.rsplit("/", 1)[0]
+
+# Checkpoint de l'état (tentatives, IPs bloquées, offset du log) ; 0 = désactivé
+CHECKPOINT_PATH = os.environ.get("DYNFW_CHECKPOINT", "/var/lib/dynfw/learner.ckpt")
+CHECKPOINT_INTERVAL = int(os.environ.get("DYNFW_CHECKPOINT_INTERVAL", "30"))
+EVENTS_READ_TIMEOUT = 60
 
 # ---------------------------------------------------------
 # STOCKAGE DES TENTATIVES
 # ---------------------------------------------------------
 attempts = defaultdict(deque)
-blocked_ips = set()
+blocked_ips = {}  # ip -> horodatage du blocage, pour éviter de bloquer plusieurs fois la même IP
+
+# Position du suivi du log et dernier événement /events appliqué (checkpoint)
+tail_position = {"inode": 0, "offset": 0}
+api_sync = {"last_event_id": 0}
 
 # ---------------------------------------------------------
 # REGEX SSH (ROBUSTE)
@@ -56,7 +87,26 @@ def is_valid_ip(ip: str) -> bool:
     except ValueError:
         return False
 
-blocked_ips = set()  # pour éviter de bloquer plusieurs fois la même IP
+def fetch_api_allowlist() -> list:
+    """Entrées d'allowlist gérées par l'API (s'ajoutent à DYNFW_ALLOWLIST_FILE)."""
+    r = requests.get(
+        f"{API_BASE}/allowlist",
+        headers={"Authorization": f"Bearer {API_TOKEN}"},
+        timeout=REQUEST_TIMEOUT
+    )
+    r.raise_for_status()
+    return [e["cidr"] for e in r.json().get("entries", [])]
+
+
+# Vérifiée avant chaque envoi : évite l'aller-retour HTTP pour une IP protégée
+allow = allowlist.AllowlistManager(loader=fetch_api_allowlist)
+
+def retry_after_seconds(r) -> float:
+    """Délai demandé par l'en-tête Retry-After (secondes), 1s par défaut."""
+    try:
+        return max(0.0, float(r.headers.get("Retry-After", "1")))
+    except ValueError:
+        return 1.0
 
 def send_block(ip: str, block_port: int | None = None) -> bool:
     """
@@ -67,6 +117,12 @@ def send_block(ip: str, block_port: int | None = None) -> bool:
     if ip in blocked_ips:
         return False
 
+    match = allow.match(ipaddress.ip_network(ip))
+    if match is not None:
+        logger.info("⚪ %s dans l'allowlist (%s) : pas de blocage", ip, match,
+                    extra={"rate_key": ip})
+        return False
+
     headers = {
         "Authorization": f"Bearer {API_TOKEN}",
         "Content-Type": "application/json"
@@ -79,91 +135,440 @@ def send_block(ip: str, block_port: int | None = None) -> bool:
         "port": block_port  # None ou numéro de port
     }
 
+    if time.monotonic() < api_backoff["until"]:
+        return False
+
     try:
-        r = requests.post(
-            API_URL,
-            json=payload,
-            headers=headers,
-            timeout=REQUEST_TIMEOUT
-        )
+        for attempt in (1, 2):
+            r = requests.post(
+                API_URL,
+                json=payload,
+                headers=headers,
+                timeout=REQUEST_TIMEOUT
+            )
+            if r.status_code != 429:
+                break
+            retry_after = retry_after_seconds(r)
+            if attempt == 1 and retry_after <= RETRY_AFTER_MAX_WAIT:
+                time.sleep(retry_after)
+                continue
+            api_backoff["until"] = time.monotonic() + retry_after
+            logger.warning("⏳ API saturée (429) : envois suspendus %.0fs", retry_after,
+                           extra={"rate_key": "429"})
+            return False
 
         if r.status_code == 200:
             if block_port:
-                logger.warning(f"🔥 IP BLOQUÉE: {ip} sur le port {block_port}")
+                logger.warning("🔥 IP BLOQUÉE: %s sur le port %s", ip, block_port)
             else:
-                logger.warning(f"🔥 IP BLOQUÉE: {ip} sur tous les ports")
-            blocked_ips.add(ip)
+                logger.warning("🔥 IP BLOQUÉE: %s sur tous les ports", ip)
+            blocked_ips[ip] = time.time()
             return True
+        elif r.status_code == 403:
+            logger.info("⚪ %s refusée par l'allowlist de l'API", ip, extra={"rate_key": ip})
         else:
-            logger.error(f"API error {r.status_code}: {r.text}")
+            logger.error("API error %d: %s", r.status_code, r.text, extra={"rate_key": r.status_code})
 
     except Exception as e:
-        logger.error(f"Erreur API: {e}")
+        logger.error("Erreur API: %s", e, extra={"rate_key": type(e).__name__})
 
     return False
 
 
 
-def tail_file(path: str):
+def tail_file(path: str, idle_ticks: bool = False, start: Optional[tuple] = None):
+    """
+    Suit le fichier comme `tail -f`.
+    - idle_ticks : True -> produit None à chaque attente (fichier inactif)
+    - start      : (inode, offset) d'un checkpoint -> reprise à cet offset si
+                   le fichier n'a pas tourné entre-temps, sinon fin du fichier
+    """
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            f.seek(0, 2)
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if start and start[0] == st.st_ino and start[1] <= st.st_size:
+                f.seek(start[1])
+                logger.info(f"⏩ Reprise à l'offset {start[1]} ({st.st_size - start[1]} octets à rattraper)")
+            else:
+                f.seek(0, 2)
+            tail_position["inode"] = st.st_ino
+            tail_position["offset"] = f.tell()
             logger.info(f"📡 Surveillance du fichier: {path}")
             while True:
-                line = f.readline()
-                if not line:
+                raw = f.readline()
+                if not raw:
+                    if idle_ticks:
+                        yield None
                     time.sleep(0.2)
                     continue
-                yield line.strip()
+                tail_position["offset"] += len(raw)
+                yield raw.decode("utf-8", errors="ignore").strip()
     except Exception as e:
         logger.error(f"Erreur lecture log: {e}")
         sys.exit(1)
 
 
+# ---------------------------------------------------------
+# CHECKPOINT & SYNCHRONISATION AVEC L'API
+# ---------------------------------------------------------
+def save_checkpoint():
+    if not CHECKPOINT_INTERVAL:
+        return
+    try:
+        size = learner_state.save(
+            CHECKPOINT_PATH, attempts, blocked_ips,
+            tail_position["inode"], tail_position["offset"], api_sync["last_event_id"]
+        )
+        logger.debug("💾 Checkpoint écrit (%d octets)", size)
+    except OSError as e:
+        logger.error("Erreur checkpoint: %s", e, extra={"rate_key": "checkpoint"})
+
+
+def restore_checkpoint() -> Optional[tuple]:
+    """Recharge l'état sauvegardé ; retourne (inode, offset) de reprise du log ou None."""
+    if not CHECKPOINT_INTERVAL:
+        return None
+    ckpt = learner_state.load(CHECKPOINT_PATH, WINDOW, BLOCK_TTL)
+    if ckpt is None:
+        return None
+
+    attempts.update(ckpt.attempts)
+    blocked_ips.update(ckpt.blocked)
+    api_sync["last_event_id"] = ckpt.last_event_id
+    logger.info(f"♻️  Checkpoint rechargé: {len(ckpt.attempts)} IP(s) en cours, {len(ckpt.blocked)} bloquée(s)")
+
+    # Au-delà d'une fenêtre, relire les lignes manquées compterait de vieilles
+    # tentatives comme récentes : on repart de la fin du fichier
+    if time.time() - ckpt.saved_at > WINDOW:
+        return None
+    return ckpt.inode, ckpt.offset
+
+
+def resync_blocked():
+    """Resynchronisation complète de blocked_ips depuis /list."""
+    r = requests.get(
+        f"{API_BASE}/list",
+        headers={"Authorization": f"Bearer {API_TOKEN}"},
+        timeout=REQUEST_TIMEOUT
+    )
+    r.raise_for_status()
+    fresh = {b["ip"]: b["ts"] for b in r.json()["blocks"]}
+    for ip in [ip for ip in blocked_ips if ip not in fresh]:
+        blocked_ips.pop(ip, None)
+    blocked_ips.update(fresh)
+    logger.info(f"🔄 {len(fresh)} IP(s) bloquée(s) côté API")
+
+
+def apply_event(event: dict):
+    kind = event.get("type")
+    if kind == "dropped":
+        # Événements perdus (ou API redémarrée) : repartir de l'état complet
+        resync_blocked()
+        return
+    if kind == "block":
+        blocked_ips[event["ip"]] = event.get("ts", time.time())
+    elif kind in ("unblock", "expire", "prune"):
+        blocked_ips.pop(event["ip"], None)
+    api_sync["last_event_id"] = event["id"]
+
+
+def follow_api_events():
+    """Thread : applique le flux /events de l'API à blocked_ips, avec reprise par id."""
+    while True:
+        try:
+            with requests.get(
+                f"{API_BASE}/events",
+                params={"format": "ndjson", "last_id": api_sync["last_event_id"]},
+                headers={"Authorization": f"Bearer {API_TOKEN}"},
+                stream=True,
+                timeout=(REQUEST_TIMEOUT, EVENTS_READ_TIMEOUT)
+            ) as r:
+                r.raise_for_status()
+                for line in r.iter_lines():
+                    if line:
+                        apply_event(json.loads(line))
+        except Exception as e:
+            logger.warning("Flux /events interrompu: %s", e, extra={"rate_key": "events"})
+        time.sleep(5)
+
+
 # ---------------------------------------------------------
 # ANALYSE DES LIGNES
 # ---------------------------------------------------------
-def handle_line(line: str):
+def extract_ip(line: str) -> Optional[str]:
+    """Retourne l'IP source d'un échec SSH, ou None si la ligne ne compte pas."""
     if "sshd" not in line.lower():
-        return
+        return None
 
     match = SSH_FAIL_REGEX.search(line)
     if not match:
-        return
+        return None
 
     ip = match.group(2)
     if not is_valid_ip(ip):
-        return
+        return None
 
-    now = time.time()
-    dq = attempts[ip]
+    return ip
+
+
+def record_attempt(table: dict, ip: str, now: float) -> int:
+    """Ajoute une tentative dans la fenêtre glissante de l'IP et retourne le total."""
+    dq = table[ip]
     dq.append(now)
 
     # Nettoyage fenêtre
     while dq and dq[0] < now - WINDOW:
         dq.popleft()
 
-    logger.info(f"🔐 {ip} → {len(dq)}/{THRESHOLD} tentatives")
+    return len(dq)
+
 
-    if len(dq) >= THRESHOLD:
-        logger.warning(f"🚨 Bruteforce détecté depuis {ip}")
+def handle_line(line: str):
+    ip = extract_ip(line)
+    if ip is None:
+        return
+
+    count = record_attempt(attempts, ip, time.time())
+
+    logger.info("🔐 %s → %d/%d tentatives", ip, count, THRESHOLD, extra={"rate_key": ip})
+
+    if count >= THRESHOLD:
+        logger.warning("🚨 Bruteforce détecté depuis %s", ip)
         if send_block(ip):
-            dq.clear()
+            attempts[ip].clear()
+
+
+# ---------------------------------------------------------
+# PIPELINE PARALLÈLE (DYNFW_WORKERS > 1)
+# ---------------------------------------------------------
+# lecteur  --(chunks de lignes, partitionnés par IP)-->  N workers
+# workers  --(IPs détectées)-->  dispatcher (processus principal)
+#
+# Chaque worker possède une partition des IPs sources (crc32 % N) :
+# sa table de fenêtres n'est jamais partagée, donc aucun verrou.
+# Comme en mode simple, la fenêtre d'une IP n'est vidée qu'après un
+# blocage réussi : le dispatcher renvoie alors ("clear", ip) à son worker.
+
+def shard_key(line: str) -> Optional[str]:
+    """
+    Clé de partition peu coûteuse (sans regex) : le jeton qui suit le
+    dernier " from ". Pour une ligne sshd valide, c'est l'IP source.
+    """
+    idx = line.rfind(" from ")
+    if idx < 0:
+        return None
+    key = line[idx + 6:].split(" ", 1)[0]
+    return key or None
+
+
+def shard_of(key: str, shards: int) -> int:
+    return zlib.crc32(key.encode()) % shards
+
+
+def _flush(buffers: list, queues: list, index: int) -> None:
+    if buffers[index]:
+        queues[index].put(buffers[index])
+        buffers[index] = []
+
+
+def _default_sigterm():
+    """Processus lecteur/workers : terminate() doit les tuer immédiatement."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _reader(source: Callable[[], Iterable[Optional[str]]], queues: list, chunk_size: int) -> None:
+    """Processus lecteur : découpe l'entrée en chunks par partition d'IP."""
+    _default_sigterm()
+    shards = len(queues)
+    buffers = [[] for _ in range(shards)]
+    try:
+        for line in source():
+            if line is None:
+                # Fichier inactif : ne pas retenir les lignes en attente
+                for i in range(shards):
+                    _flush(buffers, queues, i)
+                continue
+
+            key = shard_key(line)
+            if key is None:
+                continue
+
+            i = shard_of(key, shards)
+            buffers[i].append(line)
+            if len(buffers[i]) >= chunk_size:
+                _flush(buffers, queues, i)
+    finally:
+        for i in range(shards):
+            _flush(buffers, queues, i)
+            queues[i].put(None)
+
+
+def _worker(inbox, outbox, clear_on_detect: bool = False) -> None:
+    """
+    Processus worker : fenêtres glissantes de sa partition d'IPs.
+    `clear_on_detect` vide la fenêtre dès la détection, sans attendre la
+    confirmation du dispatcher (même travail que la boucle simple, pour le bench).
+    """
+    _default_sigterm()
+    table = defaultdict(deque)
+    signaled = {}  # ip -> dernier signalement non confirmé
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        if isinstance(chunk, tuple):
+            # ("clear", ip) : blocage confirmé par le dispatcher
+            table.pop(chunk[1], None)
+            signaled.pop(chunk[1], None)
+            continue
+
+        now = time.time()
+        detected = []
+        for line in chunk:
+            ip = extract_ip(line)
+            if ip is None:
+                continue
+            if record_attempt(table, ip, now) < THRESHOLD:
+                continue
+            if clear_on_detect:
+                table[ip].clear()
+                detected.append(ip)
+            elif now - signaled.get(ip, 0) >= DETECT_RETRY:
+                # Pas de remise à zéro ici : un envoi en échec sera retenté
+                # à une tentative suivante, comme en mode simple
+                signaled[ip] = now
+                detected.append(ip)
+
+        if len(signaled) > 4096:
+            signaled = {ip: t for ip, t in signaled.items() if now - t < WINDOW}
+        if detected:
+            outbox.put(detected)
+
+    outbox.put(None)
+
+
+def run_pipeline(
+    source: Callable[[], Iterable[Optional[str]]],
+    on_detect: Callable[[str], object],
+    workers: int = WORKERS,
+    chunk_size: int = CHUNK_LINES,
+    on_idle: Optional[Callable[[], object]] = None,
+    clear_on_detect: bool = False,
+) -> int:
+    """
+    Lance le lecteur et les workers, puis dispatche chaque détection vers
+    on_detect dans le processus courant. Retourne le nombre de détections.
+    - source    : callable (picklable) retournant un itérable de lignes
+    - on_detect : retourne True si le blocage a réussi (fenêtre de l'IP vidée)
+    - on_idle   : appelé toutes les WORKER_POLL secondes sans détection
+    - clear_on_detect : fenêtre vidée par le worker dès la détection (bench)
+    Lève RuntimeError si un processus meurt sans terminer proprement.
+    """
+    ctx = mp.get_context()
+    inboxes = [ctx.Queue(maxsize=64) for _ in range(workers)]
+    outbox = ctx.Queue()
+
+    procs = [
+        ctx.Process(target=_worker, args=(inboxes[i], outbox, clear_on_detect),
+                    name=f"dynfw-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    reader = ctx.Process(target=_reader, args=(source, inboxes, chunk_size),
+                         name="dynfw-reader", daemon=True)
+    for p in procs:
+        p.start()
+    reader.start()
+
+    detections = 0
+    remaining = workers
+    try:
+        while remaining:
+            try:
+                batch = outbox.get(timeout=WORKER_POLL)
+            except queue.Empty:
+                # Un processus tué (OOM, signal) n'enverra jamais son None
+                for p in [reader] + procs:
+                    if p.exitcode not in (None, 0):
+                        raise RuntimeError(f"{p.name} arrêté (exitcode {p.exitcode})")
+                if on_idle is not None:
+                    on_idle()
+                continue
+            if batch is None:
+                remaining -= 1
+                continue
+            for ip in batch:
+                detections += 1
+                if on_detect(ip):
+                    try:
+                        inboxes[shard_of(ip, workers)].put_nowait(("clear", ip))
+                    except queue.Full:
+                        # Worker saturé (ou terminé) : la fenêtre expirera d'elle-même
+                        pass
+    finally:
+        for p in [reader] + procs:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
+    return detections
+
+
+def dispatch_block(ip: str) -> bool:
+    logger.warning("🚨 Bruteforce détecté depuis %s", ip)
+    return send_block(ip)
+
+
+_last_checkpoint = time.monotonic()
+
+def maybe_checkpoint():
+    global _last_checkpoint
+    if CHECKPOINT_INTERVAL and time.monotonic() - _last_checkpoint >= CHECKPOINT_INTERVAL:
+        _last_checkpoint = time.monotonic()
+        save_checkpoint()
 
 
 # ---------------------------------------------------------
 # MAIN
 # ---------------------------------------------------------
+def _exit_on_sigterm(signum, frame):
+    # pkill/kill (stop_firewall.sh) : sortie normale pour que les `finally`
+    # (checkpoint final, arrêt des workers) s'exécutent
+    raise SystemExit(128 + signum)
+
+
 def main():
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    dynfw_logging.setup_logging("learner")
     logger.info("🚀 Auto-learner DynFW démarré")
     logger.info(f"LOGFILE   : {LOGFILE}")
     logger.info(f"API       : {API_URL}")
     logger.info(f"SEUIL     : {THRESHOLD}")
     logger.info(f"FENÊTRE   : {WINDOW}s")
     logger.info(f"TTL BLOCK : {BLOCK_TTL}s")
+    logger.info(f"WORKERS   : {WORKERS}")
+    allow.reload()
+
+    start = restore_checkpoint()
+    threading.Thread(target=follow_api_events, name="dynfw-api-events", daemon=True).start()
 
-    for line in tail_file(LOGFILE):
-        handle_line(line)
+    try:
+        if WORKERS > 1:
+            # Fenêtres et offset vivent dans les processus workers/lecteur :
+            # seul l'ensemble des IPs bloquées est sauvegardé
+            def on_detect(ip):
+                blocked = dispatch_block(ip)
+                maybe_checkpoint()
+                return blocked
+            run_pipeline(partial(tail_file, LOGFILE, idle_ticks=True), on_detect,
+                         on_idle=maybe_checkpoint)
+            return
+
+        for line in tail_file(LOGFILE, idle_ticks=True, start=start):
+            if line is not None:
+                handle_line(line)
+            maybe_checkpoint()
+    finally:
+        save_checkpoint()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# metrics.py - Compteurs en mémoire exposés au format texte Prometheus
+
+import threading
+from typing import Dict, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def snapshot() -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+    with _lock:
+        return dict(_counters)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    """Valeur exacte : entier sans exposant, sinon repr du flottant."""
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render(extra: Dict[str, float] = None) -> str:
+    """Compteurs (+ jauges `extra`) au format d'exposition Prometheus."""
+    lines = []
+    for (name, labels), value in sorted(snapshot().items()):
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for name, value in sorted((extra or {}).items()):
+        lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
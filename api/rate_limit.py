@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# rate_limit.py - Limitation de débit par client (token buckets) pour l'API
+#
+# Middleware ASGI pur (pas de BaseHTTPMiddleware) exécuté avant le routage :
+# un client abusif reçoit un 429 sans passer par check_token, la validation
+# Pydantic ni le logging. L'état vit dans des dicts shardés (un verrou par
+# shard) ; les entrées inactives sont évincées au fil de l'eau.
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import metrics
+
+# Budgets : débit soutenu (requêtes/s) et rafale ; rate = 0 -> pas de limite
+READ_RATE = float(os.environ.get("DYNFW_RL_READ_RATE", "20"))
+READ_BURST = int(os.environ.get("DYNFW_RL_READ_BURST", "40"))
+WRITE_RATE = float(os.environ.get("DYNFW_RL_WRITE_RATE", "20"))
+WRITE_BURST = int(os.environ.get("DYNFW_RL_WRITE_BURST", "100"))
+
+# Échecs d'authentification : au-delà de LIMIT échecs en WINDOW secondes,
+# la source est refusée pendant BAN secondes sans comparer ni loguer
+AUTH_FAIL_LIMIT = int(os.environ.get("DYNFW_AUTH_FAIL_LIMIT", "5"))
+AUTH_FAIL_WINDOW = int(os.environ.get("DYNFW_AUTH_FAIL_WINDOW", "60"))
+AUTH_FAIL_BAN = int(os.environ.get("DYNFW_AUTH_FAIL_BAN", "60"))
+
+IDLE_TTL = 300
+SHARDS = 16
+READ_METHODS = {"GET", "HEAD"}
+EXEMPT_PATHS = {"/health"}
+EXEMPT_METHODS = {"OPTIONS"}  # preflights CORS : aucun budget consommé
+
+
+class _Shard:
+    __slots__ = ("lock", "items", "swept_at")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+        self.swept_at = time.monotonic()
+
+
+class ShardedTable:
+    """Dict partitionné : les threads ne se disputent qu'un shard sur SHARDS."""
+
+    def __init__(self, shards: int = SHARDS, idle_ttl: float = IDLE_TTL):
+        self._shards = [_Shard() for _ in range(shards)]
+        self.idle_ttl = idle_ttl
+
+    def shard(self, key) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def maybe_sweep(self, shard: _Shard, now: float, is_idle: Callable[[list, float], bool]) -> None:
+        """Évince les entrées inactives, au plus une fois par idle_ttl (sous le verrou du shard)."""
+        if now - shard.swept_at < self.idle_ttl:
+            return
+        shard.swept_at = now
+        idle = [k for k, v in shard.items.items() if is_idle(v, now)]
+        for k in idle:
+            del shard.items[k]
+
+    def __len__(self) -> int:
+        return sum(len(s.items) for s in self._shards)
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        # Un bucket inactif depuis burst/rate secondes est plein : l'évincer ne change rien
+        self.table = ShardedTable(idle_ttl=max(IDLE_TTL, burst / rate if rate else 0))
+
+    def allow(self, key, now: float) -> bool:
+        if not self.rate:
+            return True
+        shard = self.table.shard(key)
+        with shard.lock:
+            bucket = shard.items.get(key)  # [jetons, dernier passage]
+            if bucket is None:
+                self.table.maybe_sweep(shard, now, lambda b, t: t - b[1] > self.table.idle_ttl)
+                shard.items[key] = [self.burst - 1, now]
+                return True
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True
+            bucket[0] = tokens
+            return False
+
+
+class AuthFailureCache:
+    def __init__(self, limit: int = AUTH_FAIL_LIMIT, window: int = AUTH_FAIL_WINDOW, ban: int = AUTH_FAIL_BAN):
+        self.limit = limit
+        self.window = window
+        self.ban = ban
+        self.table = ShardedTable(idle_ttl=max(window, ban))
+
+    def banned_for(self, key, now: float) -> float:
+        """Secondes de refus restantes (0 si la source n'est pas bannie)."""
+        entry = self.table.shard(key).items.get(key)  # [début fenêtre, échecs, banni jusqu'à]
+        if entry is None or entry[2] <= now:
+            return 0
+        return entry[2] - now
+
+    def record_failure(self, key, now: float) -> None:
+        if not self.limit:
+            return
+        shard = self.table.shard(key)
+        with shard.lock:
+            entry = shard.items.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                self.table.maybe_sweep(shard, now, lambda e, t: t - e[0] >= self.window and e[2] <= t)
+                entry = shard.items[key] = [now, 0, 0]
+            entry[1] += 1
+            if entry[1] >= self.limit:
+                entry[2] = now + self.ban
+
+
+class RateLimiter:
+    def __init__(self, is_valid_token: Callable[[str], bool]):
+        self.is_valid_token = is_valid_token
+        self.buckets = {
+            "read": TokenBuckets(READ_RATE, READ_BURST),
+            "write": TokenBuckets(WRITE_RATE, WRITE_BURST),
+        }
+        self.auth_failures = AuthFailureCache()
+
+    def check(self, client_ip: str, authorization: str, kind: str, now: float) -> Optional[tuple]:
+        """None si la requête passe, sinon (raison, secondes avant nouvel essai)."""
+        valid = bool(authorization) and self.is_valid_token(authorization)
+        # Le bannissement ne vise que les requêtes qui échoueraient : un client
+        # légitime partageant l'IP (ex. learner en local) n'est pas pénalisé
+        if not valid:
+            banned = self.auth_failures.banned_for(client_ip, now)
+            if banned:
+                return "auth", banned
+
+        buckets = self.buckets[kind]
+        # Token valide : budget propre au token, indépendant des autres clients
+        # de la même IP (ex. le learner en local face à un client abusif).
+        # Seuls les tokens valides ont un bucket : un token aléatoire ne crée pas d'état
+        if valid:
+            if not buckets.allow(("token", authorization), now):
+                return "token", 1 / buckets.rate
+            return None
+        if not buckets.allow(("ip", client_ip), now):
+            return "ip", 1 / buckets.rate
+        return None
+
+    def record_auth_failure(self, client_ip: str) -> None:
+        self.auth_failures.record_failure(client_ip, time.monotonic())
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS \
+                or scope["method"] in EXEMPT_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        authorization = ""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+                break
+        kind = "read" if scope["method"] in READ_METHODS else "write"
+
+        denied = self.limiter.check(client_ip, authorization, kind, time.monotonic())
+        if denied is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason, retry_after = denied
+        metrics.inc("dynfw_ratelimit_rejections_total", reason=reason, kind=kind)
+        body = json.dumps({"detail": "Too Many Requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
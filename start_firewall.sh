@@ -28,6 +28,7 @@ export DYNFW_DB="${DYNFW_DB:-/var/lib/dynfw/dynfw.db}"
 export DYNFW_THRESHOLD="${DYNFW_THRESHOLD:-5}"
 export DYNFW_WINDOW="${DYNFW_WINDOW:-300}"
 export DYNFW_BLOCK_TTL="${DYNFW_BLOCK_TTL:-7200}"
+export DYNFW_CHECKPOINT="${DYNFW_CHECKPOINT:-$(dirname "$DYNFW_DB")/learner.ckpt}"
 
 # ✅ Vérifier sudo + iptables
 if sudo -n /usr/sbin/iptables -L > /dev/null 2>&1; then
@@ -17,6 +17,7 @@ export DYNFW_DB="${DYNFW_DB:-$PROJECT_DIR/data/dynfw.db}"
 export DYNFW_THRESHOLD="${DYNFW_THRESHOLD:-5}"
 export DYNFW_WINDOW="${DYNFW_WINDOW:-300}"
 export DYNFW_BLOCK_TTL="${DYNFW_BLOCK_TTL:-7200}"
+export DYNFW_CHECKPOINT="${DYNFW_CHECKPOINT:-$(dirname "$DYNFW_DB")/learner.ckpt}"
 
 echo "✅ Configuration:"        
 echo "   API URL     : $DYNFW_API_URL"
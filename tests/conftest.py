@@ -0,0 +1,9 @@
+# Les modules de api/ s'importent à plat (comme lancés depuis api/)
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+# Journaux JSON des modules importés hors du dépôt
+os.environ.setdefault("DYNFW_LOG_DIR", tempfile.mkdtemp(prefix="dynfw-tests-"))
@@ -0,0 +1,89 @@
+import ipaddress
+
+import pytest
+
+import allowlist
+
+
+def net(value):
+    return ipaddress.ip_network(value, strict=False)
+
+
+@pytest.fixture
+def compiled():
+    return allowlist.Allowlist([
+        net("10.0.0.0/8"),
+        net("192.168.1.0/25"),
+        net("192.168.1.128/25"),  # adjacent : fusionné avec le précédent
+        net("203.0.113.7"),
+        net("2001:db8::/32"),
+    ])
+
+
+def test_adjacent_networks_are_collapsed(compiled):
+    assert compiled.size == 4
+    assert compiled.match(net("192.168.1.200")) == net("192.168.1.0/24")
+
+
+@pytest.mark.parametrize("target, expected", [
+    ("10.0.0.0", "10.0.0.0/8"),
+    ("10.255.255.255", "10.0.0.0/8"),
+    ("203.0.113.7", "203.0.113.7/32"),
+    ("2001:db8::1", "2001:db8::/32"),
+    # CIDR qui chevauche partiellement ou contient une entrée
+    ("203.0.113.0/24", "203.0.113.7/32"),
+    ("8.0.0.0/6", "10.0.0.0/8"),
+    ("10.1.0.0/16", "10.0.0.0/8"),
+])
+def test_match_overlaps(compiled, target, expected):
+    assert compiled.match(net(target)) == net(expected)
+
+
+@pytest.mark.parametrize("target", [
+    "9.255.255.255",
+    "11.0.0.0",
+    "203.0.113.6",
+    "203.0.113.8/29",
+    "2001:db9::1",
+])
+def test_no_match(compiled, target):
+    assert compiled.match(net(target)) is None
+
+
+def test_other_family_never_matches():
+    ipv4_only = allowlist.Allowlist([net("0.0.0.0/0")])
+
+    assert ipv4_only.match(net("::1")) is None
+    assert "1.2.3.4" in ipv4_only
+
+
+def test_empty_allowlist():
+    assert allowlist.Allowlist().match(net("1.2.3.4")) is None
+
+
+def test_parse_lines_skips_comments_and_invalid_entries():
+    lines = ["# commentaire", "", "10.0.0.0/8  # LAN", "pas-une-ip", "10.1.2.3/8"]
+
+    assert allowlist.parse_lines(lines) == [net("10.0.0.0/8"), net("10.0.0.0/8")]
+
+
+def test_overlapping_returns_every_covered_network(compiled):
+    assert compiled.overlapping(net("0.0.0.0/0")) == [
+        net("10.0.0.0/8"), net("192.168.1.0/24"), net("203.0.113.7")]
+    assert compiled.overlapping(net("10.1.0.0/16")) == [net("10.0.0.0/8")]
+    assert compiled.overlapping(net("11.0.0.0/8")) == []
+
+
+def test_generation_changes_only_with_the_networks(tmp_path):
+    path = tmp_path / "allowlist.txt"
+    path.write_text("10.0.0.0/8\n")
+    manager = allowlist.AllowlistManager(path=str(path))
+    manager.reload()
+    assert manager.generation == 1
+
+    manager.reload()
+    assert manager.generation == 1
+
+    path.write_text("10.0.0.0/8\n192.0.2.1\n")
+    manager.reload()
+    assert manager.generation == 2
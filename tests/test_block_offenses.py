@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+import firewall_api_improved as api  # noqa: E402
+
+
+class FlakyIptables:
+    """block_ip échoue `failures` fois (verrou xtables...) puis réussit."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.rules = []
+
+    def block_ip(self, ip, port=None, comment=None):
+        if self.failures:
+            self.failures -= 1
+            raise api.im.IptablesError("xtables lock")
+        self.rules.append(ip)
+
+    def unblock_ip(self, ip, port=None):
+        if ip in self.rules:
+            self.rules.remove(ip)
+
+
+@pytest.fixture
+def iptables(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "DB_PATH", str(tmp_path / "dynfw.db"))
+    monkeypatch.setattr(api, "RECIDIVE_FACTOR", 4.0)
+    monkeypatch.setattr(api, "RECIDIVE_MAX_TTL", 0)
+    monkeypatch.setattr(api, "RECIDIVE_PERMANENT_AFTER", 3)
+    fake = FlakyIptables()
+    monkeypatch.setattr(api.im, "block_ip", fake.block_ip)
+    monkeypatch.setattr(api.im, "unblock_ip", fake.unblock_ip)
+    api.init_db()
+    return fake
+
+
+def offenses(ip):
+    return api.get_offense_history(ip)
+
+
+def test_failed_blocks_are_not_counted_as_offenses(iptables):
+    iptables.failures = 3
+    for _ in range(3):
+        with pytest.raises(api.im.IptablesError):
+            api.do_block("198.51.100.7", None, "ssh", 100)
+    assert offenses("198.51.100.7") == []
+    assert api.get_block("198.51.100.7") is None
+
+    result = api.do_block("198.51.100.7", None, "ssh", 100)
+    assert result["ttl_seconds"] == 100
+    assert result["recent_offenses"] == 1
+    assert iptables.rules == ["198.51.100.7"]
+
+
+def test_repeat_offenses_escalate(iptables):
+    ttls = []
+    for _ in range(4):
+        ttls.append(api.do_block("198.51.100.8", None, "ssh", 100)["ttl_seconds"])
+        api.do_unblock("198.51.100.8")
+    assert ttls == [100, 400, 1600, None]
+
+
+def test_duplicate_block_is_ignored_unless_longer(iptables):
+    first = api.do_block("198.51.100.9", None, "ssh", 100)
+    again = api.do_block("198.51.100.9", None, "ssh", 50)
+    assert again["duplicate"] and again["expires_at"] == first["expires_at"]
+
+    longer = api.do_block("198.51.100.9", None, "manual", 10_000)
+    assert longer["extended"] and longer["expires_at"] > first["expires_at"]
+    assert iptables.rules == ["198.51.100.9"]
+    assert len(offenses("198.51.100.9")) == 1
+    assert api.get_block("198.51.100.9")["reason"] == "manual"
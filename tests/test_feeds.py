@@ -0,0 +1,46 @@
+import ipaddress
+
+import allowlist
+import feeds
+
+
+def net(value):
+    return ipaddress.ip_network(value, strict=False)
+
+
+def split(networks, allowed):
+    compiled = allowlist.Allowlist([net(a) for a in allowed])
+    return feeds.split_allowlisted([net(n) for n in networks], compiled.overlapping)
+
+
+def test_untouched_networks_are_kept():
+    kept, skipped = split(["1.2.3.0/24", "2001:db8::/32"], ["10.0.0.0/8"])
+    assert kept == [net("1.2.3.0/24"), net("2001:db8::/32")]
+    assert skipped == []
+
+
+def test_allowlisted_address_is_carved_out_of_the_range():
+    kept, skipped = split(["10.0.0.0/8"], ["10.1.2.3"])
+    assert skipped == [net("10.1.2.3")]
+    assert len(kept) == 24
+    assert sum(n.num_addresses for n in kept) == 2 ** 24 - 1
+    assert not any(n.overlaps(net("10.1.2.3")) for n in kept)
+
+
+def test_several_allowlisted_networks_in_one_range():
+    kept, skipped = split(["10.0.0.0/8"], ["10.1.2.3", "10.9.0.0/16"])
+    assert skipped == [net("10.1.2.3"), net("10.9.0.0/16")]
+    assert sum(n.num_addresses for n in kept) == 2 ** 24 - 1 - 2 ** 16
+
+
+def test_fully_covered_network_is_skipped():
+    kept, skipped = split(["192.168.5.0/24", "10.0.0.0/8"], ["192.168.0.0/16", "10.0.0.0/8"])
+    assert kept == []
+    assert skipped == [net("192.168.5.0/24"), net("10.0.0.0/8")]
+
+
+def test_invalid_lines_are_logged_without_their_content(caplog):
+    lines = ["1.2.3.0/24", "root:$6$secret:19000:0:99999:7:::"]
+    assert list(feeds.iter_networks(lines, origin="f")) == [net("1.2.3.0/24")]
+    assert "f:2" in caplog.text
+    assert "secret" not in caplog.text
@@ -0,0 +1,55 @@
+import ipaddress
+
+import pytest
+
+import ip_codec
+
+
+def covers(key_map, net):
+    family, addr, prefixlen = ip_codec.encode(net)
+    return key_map.get(prefixlen) == addr
+
+
+@pytest.mark.parametrize("address", ["0.0.0.0", "203.0.113.7", "255.255.255.255"])
+def test_covering_keys_ipv4(address):
+    addr = ipaddress.ip_address(address)
+    keys = ip_codec.covering_keys(addr)
+
+    assert sorted(keys) == list(range(33))
+    for prefixlen in range(33):
+        net = ipaddress.ip_network(f"{address}/{prefixlen}", strict=False)
+        assert covers(keys, net)
+
+
+@pytest.mark.parametrize("address", ["::", "2001:db8::1", "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff"])
+def test_covering_keys_ipv6(address):
+    addr = ipaddress.ip_address(address)
+    keys = ip_codec.covering_keys(addr)
+
+    assert sorted(keys) == list(range(129))
+    for prefixlen in (0, 1, 32, 64, 127, 128):
+        net = ipaddress.ip_network(f"{address}/{prefixlen}", strict=False)
+        assert covers(keys, net)
+
+
+def test_covering_keys_reject_non_covering_networks():
+    keys = ip_codec.covering_keys(ipaddress.ip_address("203.0.113.7"))
+
+    assert not covers(keys, ipaddress.ip_network("203.0.114.0/24"))
+    assert not covers(keys, ipaddress.ip_network("203.0.113.8/32"))
+    assert not covers(keys, ipaddress.ip_network("203.0.113.0/30"))
+
+
+def test_keys_are_fixed_width_and_ordered():
+    low = ip_codec.pack(ipaddress.ip_address("9.255.255.255"))
+    high = ip_codec.pack(ipaddress.ip_address("10.0.0.0"))
+
+    assert len(low) == len(high) == ip_codec.ADDR_LEN
+    assert low < high
+
+
+def test_target_str_round_trip():
+    assert ip_codec.target_str(ip_codec.parse_target("203.0.113.7")) == "203.0.113.7"
+    assert ip_codec.target_str(ip_codec.parse_target("203.0.113.0/24")) == "203.0.113.0/24"
+    with pytest.raises(ValueError):
+        ip_codec.parse_target("203.0.113.7/24")
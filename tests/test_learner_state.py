@@ -0,0 +1,93 @@
+from collections import deque
+
+import pytest
+
+import learner_state
+
+NOW = 1_700_000_000.0
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "learner.ckpt")
+    attempts = {
+        "203.0.113.7": deque([NOW - 10, NOW - 5, NOW - 1]),
+        "2001:db8::1": deque([NOW - 2]),
+    }
+    blocked = {"198.51.100.1": NOW - 60, "2001:db8::2": NOW - 30}
+
+    size = learner_state.save(path, attempts, blocked, inode=42, offset=1234,
+                              last_event_id=99, now=NOW)
+    ckpt = learner_state.load(path, window=300, block_ttl=7200, now=NOW)
+
+    assert size == (tmp_path / "learner.ckpt").stat().st_size
+    assert (ckpt.inode, ckpt.offset, ckpt.last_event_id, ckpt.saved_at) == (42, 1234, 99, NOW)
+    assert set(ckpt.attempts) == set(attempts)
+    for ip, times in attempts.items():
+        # Âges en float32 : précision sub-milliseconde sur la fenêtre
+        assert list(ckpt.attempts[ip]) == pytest.approx(list(times), abs=1e-3)
+    assert ckpt.blocked == blocked
+
+
+def test_load_prunes_stale_entries(tmp_path):
+    path = str(tmp_path / "learner.ckpt")
+    attempts = {"203.0.113.7": deque([NOW - 400, NOW - 100]), "203.0.113.8": deque([NOW - 500])}
+    blocked = {"198.51.100.1": NOW - 8000, "198.51.100.2": NOW - 100}
+    learner_state.save(path, attempts, blocked, now=NOW)
+
+    ckpt = learner_state.load(path, window=300, block_ttl=7200, now=NOW)
+
+    assert list(ckpt.attempts) == ["203.0.113.7"]
+    assert len(ckpt.attempts["203.0.113.7"]) == 1
+    assert ckpt.blocked == {"198.51.100.2": NOW - 100}
+
+
+def test_empty_and_cidr_blocked_entries_are_skipped(tmp_path):
+    path = str(tmp_path / "learner.ckpt")
+    learner_state.save(path, {"203.0.113.7": deque()}, {"203.0.113.0/24": NOW}, now=NOW)
+
+    ckpt = learner_state.load(path, window=300, block_ttl=7200, now=NOW)
+
+    assert ckpt.attempts == {}
+    assert ckpt.blocked == {}
+
+
+def test_attempts_are_capped_per_ip(tmp_path):
+    path = str(tmp_path / "learner.ckpt")
+    times = deque(NOW - 1 + i * 1e-6 for i in range(learner_state.MAX_ATTEMPTS_PER_IP + 10))
+    learner_state.save(path, {"203.0.113.7": times}, {}, now=NOW)
+
+    ckpt = learner_state.load(path, window=300, block_ttl=7200, now=NOW)
+
+    assert len(ckpt.attempts["203.0.113.7"]) == learner_state.MAX_ATTEMPTS_PER_IP
+
+
+def test_no_temporary_file_left_behind(tmp_path):
+    path = str(tmp_path / "sub" / "learner.ckpt")
+    learner_state.save(path, {}, {}, now=NOW)
+
+    assert sorted(p.name for p in (tmp_path / "sub").iterdir()) == ["learner.ckpt"]
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"XXXX" + b"\0" * (learner_state.HEADER.size - 4),
+    learner_state.HEADER.pack(learner_state.MAGIC, learner_state.VERSION + 1, 0, 0, 0, NOW, 0, 0),
+])
+def test_invalid_header_returns_none(tmp_path, content):
+    path = tmp_path / "learner.ckpt"
+    path.write_bytes(content)
+
+    assert learner_state.load(str(path), window=300, block_ttl=7200, now=NOW) is None
+
+
+def test_truncated_body_returns_none(tmp_path):
+    path = tmp_path / "learner.ckpt"
+    learner_state.save(str(path), {"203.0.113.7": deque([NOW - 1, NOW - 2])}, {}, now=NOW)
+    path.write_bytes(path.read_bytes()[:-3])
+
+    assert learner_state.load(str(path), window=300, block_ttl=7200, now=NOW) is None
+
+
+def test_missing_file_returns_none(tmp_path):
+    assert learner_state.load(str(tmp_path / "absent"), window=300, block_ttl=7200) is None
+